@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from airflow import DAG
 from airflow.operators.python import PythonOperator
 from airflow.operators.bash import BashOperator
-from kafka import KafkaConsumer
-import json
+from confluent_kafka import Consumer, KafkaException
+import orjson
+import operator
+import re
+import numpy as np
 import pandas as pd
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import pyarrow as pa
+import pyarrow.parquet as pq
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import os
 import sys
 
@@ -16,8 +22,9 @@ import sys
 sys.path.append('/opt/airflow/dags')
 sys.path.append('/home/project')
 
-from ml.predict_delay import DelayPredictor
+from ml.predict_delay import get_predictor
 from utils.alerting import AlertManager
+from utils.pg_copy import copy_binary
 
 # Default arguments for the DAG
 default_args = {
@@ -41,255 +48,521 @@ dag = DAG(
     tags=['ml', 'supply-chain', 'prediction']
 )
 
-def consume_kafka_data(**context):
-    """Consume shipment data from Kafka topic"""
-    print("Starting Kafka consumer...")
+# Maximum number of Kafka messages processed per DAG run
+KAFKA_BATCH_SIZE = 1000
+
+# Number of active shipments fetched and scored per chunk
+PREDICTION_CHUNK_SIZE = 5000
+
+# Shipment statuses that are still eligible for delay prediction
+ACTIVE_STATUSES = ('In Transit', 'At Hub', 'Out for Delivery', 'Delayed')
+
+# Directory used to hand batches between tasks (only the file path goes through XCom)
+STAGING_DIR = os.getenv('PIPELINE_STAGING_DIR', '/tmp/delay_prediction_pipeline')
+
+# Fields every shipment update must carry to be stored
+SHIPMENT_FIELDS = (
+    'shipment_id', 'origin', 'destination', 'current_location', 'status', 'eta',
+    'distance_remaining_km', 'vehicle_speed_kmph', 'weather', 'traffic_level', 'timestamp'
+)
+_REQUIRED_FIELDS = frozenset(SHIPMENT_FIELDS)
+
+# Value domains of the shipment enum columns (see the shipment_status,
+# weather_condition and traffic_level types)
+VALID_STATUSES = frozenset({'In Transit', 'At Hub', 'Out for Delivery', 'Delayed', 'Delivered'})
+VALID_WEATHER = frozenset({'Clear', 'Rain', 'Snow', 'Fog', 'Storm'})
+VALID_TRAFFIC_LEVELS = frozenset({'Light', 'Moderate', 'Heavy', 'Very Heavy'})
+
+# Text columns and their maximum lengths (None allowed where the column is nullable)
+TEXT_FIELD_LIMITS = {
+    'shipment_id': (50, False),
+    'origin': (100, False),
+    'destination': (100, False),
+    'current_location': (100, True),
+}
+
+# Numeric columns and their accepted [min, max) ranges; distance is stored as
+# INTEGER and speed as DECIMAL(5,2)
+NUMERIC_FIELD_RANGES = {
+    'distance_remaining_km': (0, 2 ** 31),
+    'vehicle_speed_kmph': (0, 1000),
+}
+
+# shipment_history columns loaded by binary COPY and their wire types
+# (enums and varchars are sent as text)
+HISTORY_COLUMNS = (
+    'shipment_id', 'timestamp', 'status', 'current_location', 'distance_remaining_km',
+    'vehicle_speed_kmph', 'weather', 'traffic_level', 'raw_data'
+)
+HISTORY_COLUMN_TYPES = (
+    'text', 'timestamptz', 'text', 'text', 'int4', 'numeric', 'text', 'text', 'jsonb'
+)
+
+# Tuple builders for the shipments upsert and the shipment_history COPY
+_shipment_row = operator.itemgetter(*SHIPMENT_FIELDS)
+_history_row = operator.itemgetter(*HISTORY_COLUMNS[:-1])
+
+# Delay probability at which an alert is escalated to High severity
+HIGH_SEVERITY_THRESHOLD = 0.8
+
+# Daily-partitioned tables and how many days of partitions each one keeps
+PARTITION_RETENTION_DAYS = {
+    'shipment_history': 30,
+    'delay_predictions': 7,
+}
+
+# Partitions created without WAL; history is rebuildable from Kafka and may be
+# lost on a database crash
+UNLOGGED_TABLES = {'shipment_history'}
+
+# Connection pool shared by all tasks running in this worker process
+_db_pool = None
+
+def get_db_pool():
+    """Get the worker's PostgreSQL connection pool, creating it on first use"""
+    global _db_pool
+    
+    if _db_pool is None:
+        database_url = os.getenv('DATABASE_URL')
+        if not database_url:
+            raise ValueError("DATABASE_URL not found in environment")
+        _db_pool = ThreadedConnectionPool(1, 4, dsn=database_url)
+    
+    return _db_pool
+
+def stage_records(records, name, context):
+    """Write records to a Parquet file in the staging directory and return its path"""
+    run_id = re.sub(r'[^A-Za-z0-9_.-]', '_', context['run_id'])
+    path = os.path.join(STAGING_DIR, f"{run_id}_{name}.parquet")
+    
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    pq.write_table(pa.Table.from_pylist(records), path, compression='zstd')
+    
+    return path
+
+def load_staged_records(path):
+    """Read records staged by stage_records back into a list of dictionaries"""
+    return pq.read_table(path).to_pylist()
+
+def ensure_daily_partitions(cursor, days_ahead=1):
+    """Create today's (and the next days') partitions of the partitioned tables"""
+    for table in PARTITION_RETENTION_DAYS:
+        cursor.execute("""
+            SELECT create_daily_partition(%s, (NOW() AT TIME ZONE 'UTC')::date + day_offset, %s)
+            FROM generate_series(0, %s) AS day_offset
+        """, (table, table in UNLOGGED_TABLES, days_ahead))
+
+def drop_expired_partitions(cursor, table, retention_days):
+    """Detach and drop daily partitions that lie entirely outside the retention window"""
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = %s
+    """, (table,))
+    
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    dropped = 0
+    
+    for (partition,) in cursor.fetchall():
+        try:
+            # Partition names are UTC days, matching create_daily_partition's bounds
+            partition_day = datetime.strptime(partition.rsplit('_', 1)[-1], '%Y%m%d').replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        
+        # Only drop once the partition's upper bound has passed the cutoff
+        if partition_day + timedelta(days=1) <= cutoff:
+            cursor.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                sql.Identifier(table), sql.Identifier(partition)
+            ))
+            cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition)))
+            dropped += 1
     
+    return dropped
+
+def decode_messages(values):
+    """Decode a batch of raw Kafka values, falling back to per-record decoding on bad JSON"""
+    # Tombstones (deleted keys) carry no value and are not shipment updates
+    values = [value for value in values if value is not None]
+    
+    # Decode the batch as one JSON array, but only trust it when every value is framed
+    # as a single object and the array has one element per message; otherwise a payload
+    # such as '{...},{...}' would silently pass as two records
+    if all(value[:1] == b'{' and value[-1:] == b'}' for value in values):
+        try:
+            messages = orjson.loads(b'[' + b','.join(values) + b']')
+            if len(messages) == len(values):
+                return messages
+        except orjson.JSONDecodeError:
+            pass
+    
+    messages = []
+    for value in values:
+        try:
+            message = orjson.loads(value)
+        except orjson.JSONDecodeError as e:
+            print(f"Error processing message: {e}")
+            continue
+        if not isinstance(message, dict):
+            print(f"Error processing message: expected a JSON object, got {type(message).__name__}")
+            continue
+        messages.append(message)
+    return messages
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp as produced by the shipment producer"""
+    if isinstance(value, datetime):
+        return value
+    # fromisoformat only accepts a trailing 'Z' from Python 3.11 on
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
+
+def has_valid_fields(message):
+    """Check a shipment update's enum, text and numeric fields against their column domains"""
+    if (
+        message['status'] not in VALID_STATUSES
+        or message['weather'] not in VALID_WEATHER
+        or message['traffic_level'] not in VALID_TRAFFIC_LEVELS
+    ):
+        return False
+    
+    for field, (max_length, nullable) in TEXT_FIELD_LIMITS.items():
+        value = message[field]
+        if value is None:
+            if not nullable:
+                return False
+        elif not isinstance(value, str) or len(value) > max_length:
+            return False
+    
+    for field, (low, high) in NUMERIC_FIELD_RANGES.items():
+        value = message[field]
+        # bool is an int subclass but never a valid measurement; the range check
+        # also rejects NaN
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value < high:
+            return False
+    
+    return True
+
+def validate_messages(messages):
+    """Drop malformed shipment updates and parse their timestamps once"""
+    valid = []
+    
+    # One bad value would fail the whole upsert/COPY, and since offsets are only
+    # committed after the batch is stored, the same batch would be retried forever
+    for message in messages:
+        if not isinstance(message, dict) or not _REQUIRED_FIELDS <= message.keys():
+            continue
+        if not has_valid_fields(message):
+            continue
+        
+        # Timestamps are bound as datetimes from here on instead of being
+        # re-parsed from text by every statement that uses them
+        try:
+            message['timestamp'] = parse_timestamp(message['timestamp'])
+            message['eta'] = parse_timestamp(message['eta'])
+        except (TypeError, ValueError, AttributeError):
+            continue
+        
+        valid.append(message)
+    
+    if len(valid) < len(messages):
+        print(f"Skipped {len(messages) - len(valid)} malformed messages")
+    
+    return valid
+
+def create_kafka_consumer():
+    """Create a Kafka consumer subscribed to the shipment updates topic"""
     bootstrap_servers = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092')
     topic = os.getenv('KAFKA_TOPIC', 'shipment_updates')
     
-    try:
-        consumer = KafkaConsumer(
-            topic,
-            bootstrap_servers=bootstrap_servers,
-            value_deserializer=lambda m: json.loads(m.decode('utf-8')),
-            consumer_timeout_ms=30000,  # 30 second timeout
-            auto_offset_reset='latest'
+    consumer = Consumer({
+        'bootstrap.servers': bootstrap_servers,
+        'group.id': os.getenv('KAFKA_GROUP_ID', 'delay-prediction-pipeline'),
+        'auto.offset.reset': 'latest',
+        # Offsets are committed only after the batch is stored in the database
+        'enable.auto.commit': False,
+        'fetch.min.bytes': 1_048_576,
+        'fetch.wait.max.ms': 200,
+        'fetch.max.bytes': 52_428_800,
+        'max.partition.fetch.bytes': 10_485_760,
+        'socket.receive.buffer.bytes': 2_097_152,
+        # Brokers already validate batch CRCs on produce
+        'check.crcs': False
+    })
+    consumer.subscribe([topic])
+    
+    print(f"Consuming from topic: {topic}")
+    return consumer
+
+def consume_kafka_data(consumer):
+    """Consume a batch of shipment updates from the Kafka topic"""
+    print("Starting Kafka consumer...")
+    
+    # Errors are not swallowed here: records may already have been polled, and
+    # returning an empty batch would let the caller commit their offsets and
+    # silently drop them. Failing the task replays the batch instead.
+    messages = []
+    
+    # Pull whole fetch responses at a time; stop once the batch is full
+    # or the topic goes quiet
+    while len(messages) < KAFKA_BATCH_SIZE:
+        records = consumer.consume(
+            num_messages=KAFKA_BATCH_SIZE - len(messages),
+            timeout=5.0
         )
+        if not records:
+            break
         
-        messages = []
-        message_count = 0
-        
-        print(f"Consuming from topic: {topic}")
-        
-        for message in consumer:
-            try:
-                shipment_data = message.value
-                messages.append(shipment_data)
-                message_count += 1
-                
-                # Process in batches to avoid memory issues
-                if message_count >= 1000:
-                    break
-                    
-            except Exception as e:
-                print(f"Error processing message: {e}")
+        values = []
+        for record in records:
+            if record.error():
+                print(f"Error processing message: {record.error()}")
                 continue
+            values.append(record.value())
         
-        consumer.close()
-        
-        print(f"Consumed {len(messages)} messages from Kafka")
-        
-        # Store data for next task
-        context['task_instance'].xcom_push(key='kafka_messages', value=messages)
-        
-        return len(messages)
-        
-    except Exception as e:
-        print(f"Error consuming from Kafka: {e}")
-        # Return empty list if Kafka is not available
-        context['task_instance'].xcom_push(key='kafka_messages', value=[])
-        return 0
+        messages.extend(decode_messages(values))
+    
+    messages = validate_messages(messages)
+    
+    print(f"Consumed {len(messages)} messages from Kafka")
+    return messages
+
+def commit_kafka_offsets(consumer):
+    """Commit the consumer's current positions once the batch has been stored"""
+    try:
+        consumer.commit(asynchronous=False)
+    except KafkaException as e:
+        # Raised with _NO_OFFSET when nothing was consumed in this run
+        print(f"No Kafka offsets committed: {e}")
 
-def store_shipment_data(**context):
-    """Store consumed shipment data in PostgreSQL"""
-    print("Storing shipment data in database...")
+def store_shipment_data(cursor, messages):
+    """Store validated shipment updates and return the latest update per shipment"""
+    # Keep only the latest update per shipment; a single upsert statement
+    # cannot touch the same row twice
+    latest_updates = {message['shipment_id']: message for message in messages}
     
-    # Get data from previous task
-    messages = context['task_instance'].xcom_pull(
-        task_ids='consume_kafka_data', 
-        key='kafka_messages'
-    )
+    shipments_rows = [_shipment_row(message) for message in latest_updates.values()]
+    history_rows = [
+        _history_row(message) + (orjson.dumps(message),)
+        for message in messages
+    ]
     
-    if not messages:
-        print("No messages to process")
-        return 0
+    # Insert or update shipments
+    execute_values(cursor, """
+        INSERT INTO shipments (
+            shipment_id, origin, destination, current_location, 
+            status, eta, distance_remaining_km, vehicle_speed_kmph, 
+            weather, traffic_level, updated_at
+        ) VALUES %s
+        ON CONFLICT (shipment_id) DO UPDATE SET
+            current_location = EXCLUDED.current_location,
+            status = EXCLUDED.status,
+            eta = EXCLUDED.eta,
+            distance_remaining_km = EXCLUDED.distance_remaining_km,
+            vehicle_speed_kmph = EXCLUDED.vehicle_speed_kmph,
+            weather = EXCLUDED.weather,
+            traffic_level = EXCLUDED.traffic_level,
+            updated_at = EXCLUDED.updated_at
+    """, shipments_rows, page_size=1000)
     
-    database_url = os.getenv('DATABASE_URL')
-    if not database_url:
-        raise ValueError("DATABASE_URL not found in environment")
+    # Stream history records with binary COPY (append-only, no conflict handling
+    # needed); numbers, timestamps and JSON skip text formatting and parsing
+    copy_binary(cursor, 'shipment_history', HISTORY_COLUMNS, HISTORY_COLUMN_TYPES, history_rows)
     
+    print(f"Stored {len(history_rows)} shipment records")
+    
+    return list(latest_updates.values())
+
+def store_predictions(cursor, predictions, threshold):
+    """Insert a batch of predictions and return the ones at or above the alert threshold"""
+    return execute_values(cursor, sql.SQL("""
+        WITH inserted AS (
+            INSERT INTO delay_predictions (
+                shipment_id, delay_probability, predicted_delay_minutes,
+                model_version, features
+            ) VALUES %s
+            RETURNING shipment_id, delay_probability, predicted_delay_minutes,
+                      model_version, features, prediction_timestamp
+        )
+        SELECT shipment_id,
+               delay_probability::float8 AS delay_probability,
+               predicted_delay_minutes AS estimated_delay_minutes,
+               model_version,
+               features,
+               prediction_timestamp::text AS prediction_timestamp
+        FROM inserted
+        WHERE delay_probability >= {threshold}
+    """).format(threshold=sql.Literal(threshold)), [
+        (
+            prediction['shipment_id'],
+            prediction['delay_probability'],
+            prediction['estimated_delay_minutes'],
+            prediction['model_version'],
+            orjson.dumps(prediction.get('features', {})).decode()
+        )
+        for prediction in predictions
+    ], page_size=500, fetch=True)
+
+def ingest_and_predict(**context):
+    """Consume shipment updates, store them and predict delays in a single pass"""
+    consumer = create_kafka_consumer()
     try:
-        conn = psycopg2.connect(database_url)
-        cursor = conn.cursor()
-        
-        stored_count = 0
-        
-        for message in messages:
-            try:
-                # Insert or update shipment
-                cursor.execute("""
-                    INSERT INTO shipments (
-                        shipment_id, origin, destination, current_location, 
-                        status, eta, distance_remaining_km, vehicle_speed_kmph, 
-                        weather, traffic_level, updated_at
-                    ) VALUES (
-                        %(shipment_id)s, %(origin)s, %(destination)s, %(current_location)s,
-                        %(status)s, %(eta)s, %(distance_remaining_km)s, %(vehicle_speed_kmph)s,
-                        %(weather)s, %(traffic_level)s, %(timestamp)s
-                    )
-                    ON CONFLICT (shipment_id) DO UPDATE SET
-                        current_location = EXCLUDED.current_location,
-                        status = EXCLUDED.status,
-                        eta = EXCLUDED.eta,
-                        distance_remaining_km = EXCLUDED.distance_remaining_km,
-                        vehicle_speed_kmph = EXCLUDED.vehicle_speed_kmph,
-                        weather = EXCLUDED.weather,
-                        traffic_level = EXCLUDED.traffic_level,
-                        updated_at = EXCLUDED.updated_at
-                """, message)
-                
-                # Insert history record
-                cursor.execute("""
-                    INSERT INTO shipment_history (
-                        shipment_id, timestamp, status, current_location,
-                        distance_remaining_km, vehicle_speed_kmph, weather,
-                        traffic_level, raw_data
-                    ) VALUES (
-                        %(shipment_id)s, %(timestamp)s, %(status)s, %(current_location)s,
-                        %(distance_remaining_km)s, %(vehicle_speed_kmph)s, %(weather)s,
-                        %(traffic_level)s, %(raw_data)s
-                    )
-                """, {
-                    **message,
-                    'raw_data': json.dumps(message)
-                })
-                
-                stored_count += 1
-                
-            except Exception as e:
-                print(f"Error storing message {message.get('shipment_id', 'unknown')}: {e}")
-                continue
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        print(f"Stored {stored_count} shipment records")
-        return stored_count
-        
+        messages = consume_kafka_data(consumer)
     except Exception as e:
-        print(f"Database error: {e}")
+        print(f"Error consuming from Kafka: {e}")
+        consumer.close()
         raise
-
-def predict_delays(**context):
-    """Run ML model to predict shipment delays"""
-    print("Running delay prediction model...")
     
-    database_url = os.getenv('DATABASE_URL')
-    if not database_url:
-        raise ValueError("DATABASE_URL not found in environment")
+    pool = get_db_pool()
+    conn = pool.getconn()
     
     try:
-        # Load predictor
-        predictor = DelayPredictor()
-        
-        # Get active shipments from database
-        conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT shipment_id, origin, destination, current_location,
-                   distance_remaining_km, vehicle_speed_kmph, weather,
-                   traffic_level, updated_at as timestamp
-            FROM shipments
-            WHERE status IN ('In Transit', 'At Hub', 'Out for Delivery', 'Delayed')
-            AND distance_remaining_km > 0
-        """)
+        # Get the cached predictor (loaded once per worker process)
+        predictor = get_predictor()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        threshold = float(os.getenv('PREDICTION_THRESHOLD', 0.7))
         
-        active_shipments = cursor.fetchall()
-        print(f"Found {len(active_shipments)} active shipments")
+        # History rows and predictions land in daily partitions
+        ensure_daily_partitions(cursor)
         
-        if not active_shipments:
-            cursor.close()
-            conn.close()
-            return 0
+        latest_updates = []
+        if messages:
+            print("Storing shipment data in database...")
+            latest_updates = store_shipment_data(cursor, messages)
         
-        # Convert to list of dictionaries
-        shipment_list = [dict(shipment) for shipment in active_shipments]
+        print("Running delay prediction model...")
         
-        # Make predictions
-        predictions = predictor.predict_batch(shipment_list)
+        # Shipments updated in this batch are scored straight from memory
+        batch_shipments = pd.DataFrame([
+            shipment for shipment in latest_updates
+            if shipment['status'] in ACTIVE_STATUSES
+            and (shipment['distance_remaining_km'] or 0) > 0
+        ])
         
-        # Store predictions in database
+        # Only predictions at or above the alert threshold come back from the insert
         prediction_count = 0
-        
-        for prediction in predictions:
-            try:
-                cursor.execute("""
-                    INSERT INTO delay_predictions (
-                        shipment_id, delay_probability, predicted_delay_minutes,
-                        model_version, features
-                    ) VALUES (
-                        %(shipment_id)s, %(delay_probability)s, %(estimated_delay_minutes)s,
-                        %(model_version)s, %(features)s
-                    )
-                """, {
-                    'shipment_id': prediction['shipment_id'],
-                    'delay_probability': prediction['delay_probability'],
-                    'estimated_delay_minutes': prediction['estimated_delay_minutes'],
-                    'model_version': prediction['model_version'],
-                    'features': json.dumps(prediction.get('features', {}))
-                })
-                
-                prediction_count += 1
+        high_risk_predictions = []
+        if not batch_shipments.empty:
+            predictions = predictor.predict_batch(batch_shipments)
+            high_risk_predictions.extend(store_predictions(cursor, predictions, threshold))
+            prediction_count += len(predictions)
+        
+        # Remaining active shipments are streamed through a server-side cursor
+        # so that large fleets are scored chunk by chunk
+        shipments_cursor = conn.cursor(name='active_shipments_cur')
+        shipments_cursor.itersize = PREDICTION_CHUNK_SIZE
+        
+        try:
+            shipments_cursor.execute("""
+                SELECT shipment_id, origin, destination, current_location,
+                       distance_remaining_km, vehicle_speed_kmph, weather,
+                       traffic_level, updated_at as timestamp
+                FROM shipments
+                WHERE status IN %s
+                AND distance_remaining_km > 0
+                AND shipment_id <> ALL(%s)
+            """, (ACTIVE_STATUSES, [shipment['shipment_id'] for shipment in latest_updates]))
+            
+            while True:
+                rows = shipments_cursor.fetchmany(PREDICTION_CHUNK_SIZE)
+                if not rows:
+                    break
                 
-            except Exception as e:
-                print(f"Error storing prediction for {prediction.get('shipment_id')}: {e}")
-                continue
+                # Make predictions for the whole chunk at once
+                chunk = pd.DataFrame(
+                    rows,
+                    columns=[column[0] for column in shipments_cursor.description]
+                )
+                chunk_predictions = predictor.predict_batch(chunk)
+                high_risk_predictions.extend(store_predictions(cursor, chunk_predictions, threshold))
+                prediction_count += len(chunk_predictions)
+        finally:
+            shipments_cursor.close()
         
         conn.commit()
         cursor.close()
-        conn.close()
         
-        print(f"Stored {prediction_count} predictions")
+        # The batch is durable now; a failure before this point replays it
+        commit_kafka_offsets(consumer)
         
-        # Store predictions for alerting task
-        context['task_instance'].xcom_push(key='predictions', value=predictions)
+        print(f"Stored {prediction_count} predictions ({len(high_risk_predictions)} high risk)")
+        
+        if not high_risk_predictions:
+            context['task_instance'].xcom_push(key='predictions_path', value=None)
+            return prediction_count
+        
+        # Stage only the high-risk predictions for the alerting task
+        context['task_instance'].xcom_push(
+            key='predictions_path',
+            value=stage_records([dict(row) for row in high_risk_predictions], 'predictions', context)
+        )
         
         return prediction_count
         
     except Exception as e:
-        print(f"Error in prediction task: {e}")
+        print(f"Error in ingest and prediction task: {e}")
         raise
+    finally:
+        pool.putconn(conn)
+        consumer.close()
+
+def build_alert_payload(prediction, delay_probability):
+    """Build the alert for a prediction that crossed the alert threshold"""
+    return {
+        'shipment_id': prediction['shipment_id'],
+        'alert_type': 'delay_prediction',
+        'severity': 'High' if delay_probability >= HIGH_SEVERITY_THRESHOLD else 'Medium',
+        'title': f"High Delay Risk - {prediction['shipment_id']}",
+        'message': f"Shipment has {delay_probability:.1%} probability of delay. "
+                  f"Estimated delay: {prediction['estimated_delay_minutes']} minutes.",
+        'metadata': prediction
+    }
 
 def trigger_alerts(**context):
     """Trigger alerts for high-risk shipments"""
     print("Processing alerts for high-risk shipments...")
     
     # Get predictions from previous task
-    predictions = context['task_instance'].xcom_pull(
-        task_ids='predict_delays',
-        key='predictions'
+    predictions_path = context['task_instance'].xcom_pull(
+        task_ids='ingest_and_predict',
+        key='predictions_path'
     )
     
-    if not predictions:
+    if not predictions_path:
         print("No predictions to process")
         return 0
     
+    predictions = load_staged_records(predictions_path)
+    
     try:
         alert_manager = AlertManager()
         threshold = float(os.getenv('PREDICTION_THRESHOLD', 0.7))
         
-        alert_count = 0
+        # Staged rows were already filtered in SQL; re-checking is cheap and keeps
+        # this task correct if the threshold changes between tasks
+        probabilities = np.fromiter(
+            (prediction.get('delay_probability') or 0 for prediction in predictions),
+            dtype=np.float64,
+            count=len(predictions)
+        )
+        high_risk = np.flatnonzero(probabilities >= threshold)
         
-        for prediction in predictions:
-            delay_probability = prediction.get('delay_probability', 0)
-            
-            if delay_probability >= threshold:
-                # Create alert
-                alert_data = {
-                    'shipment_id': prediction['shipment_id'],
-                    'alert_type': 'delay_prediction',
-                    'severity': 'High' if delay_probability >= 0.8 else 'Medium',
-                    'title': f"High Delay Risk - {prediction['shipment_id']}",
-                    'message': f"Shipment has {delay_probability:.1%} probability of delay. "
-                              f"Estimated delay: {prediction['estimated_delay_minutes']} minutes.",
-                    'metadata': prediction
-                }
-                
-                if alert_manager.create_alert(alert_data):
-                    alert_count += 1
+        # Payloads (and their f-strings) are only built for rows above the threshold
+        alert_payloads = [
+            build_alert_payload(predictions[index], float(probabilities[index]))
+            for index in high_risk
+        ]
+        
+        # One dedup query and one multi-row INSERT for the whole batch
+        alert_count = alert_manager.create_alerts_bulk(alert_payloads) if alert_payloads else 0
+        
+        # Let background Slack notifications finish before the task exits
+        alert_manager.close()
+        
+        os.remove(predictions_path)
         
         print(f"Triggered {alert_count} alerts")
         return alert_count
@@ -302,25 +575,19 @@ def cleanup_old_data(**context):
     """Clean up old data to prevent database bloat"""
     print("Cleaning up old data...")
     
-    database_url = os.getenv('DATABASE_URL')
-    if not database_url:
-        raise ValueError("DATABASE_URL not found in environment")
+    pool = get_db_pool()
+    conn = pool.getconn()
     
     try:
-        conn = psycopg2.connect(database_url)
         cursor = conn.cursor()
         
-        # Delete old history records (keep last 30 days)
-        cursor.execute("""
-            DELETE FROM shipment_history 
-            WHERE created_at < NOW() - INTERVAL '30 days'
-        """)
+        # Drop whole partitions of old history (30 days) and predictions (7 days)
+        for table, retention_days in PARTITION_RETENTION_DAYS.items():
+            dropped = drop_expired_partitions(cursor, table, retention_days)
+            print(f"Dropped {dropped} expired partitions of {table}")
         
-        # Delete old predictions (keep last 7 days)
-        cursor.execute("""
-            DELETE FROM delay_predictions 
-            WHERE created_at < NOW() - INTERVAL '7 days'
-        """)
+        # Pre-create upcoming partitions so ingestion never hits a missing range
+        ensure_daily_partitions(cursor)
         
         # Archive resolved alerts (keep last 30 days)
         cursor.execute("""
@@ -331,7 +598,6 @@ def cleanup_old_data(**context):
         
         conn.commit()
         cursor.close()
-        conn.close()
         
         print("Data cleanup completed")
         return True
@@ -339,23 +605,13 @@ def cleanup_old_data(**context):
     except Exception as e:
         print(f"Error in cleanup task: {e}")
         return False
+    finally:
+        pool.putconn(conn)
 
 # Define tasks
-consume_kafka_task = PythonOperator(
-    task_id='consume_kafka_data',
-    python_callable=consume_kafka_data,
-    dag=dag,
-)
-
-store_data_task = PythonOperator(
-    task_id='store_shipment_data',
-    python_callable=store_shipment_data,
-    dag=dag,
-)
-
-predict_task = PythonOperator(
-    task_id='predict_delays',
-    python_callable=predict_delays,
+ingest_predict_task = PythonOperator(
+    task_id='ingest_and_predict',
+    python_callable=ingest_and_predict,
     dag=dag,
 )
 
@@ -379,28 +635,18 @@ health_check_task = BashOperator(
 )
 
 # Define task dependencies
-consume_kafka_task >> store_data_task >> predict_task >> alert_task >> cleanup_task >> health_check_task
+ingest_predict_task >> alert_task >> cleanup_task >> health_check_task
 
 # Add task documentation
-consume_kafka_task.doc_md = """
-## Consume Kafka Data
-
-This task consumes real-time shipment updates from the Kafka topic 'shipment_updates'.
-It processes messages in batches and passes them to the next task for storage.
-"""
-
-store_data_task.doc_md = """
-## Store Shipment Data
-
-This task stores the consumed shipment data in PostgreSQL, maintaining both current
-shipment status and historical records for trend analysis.
-"""
-
-predict_task.doc_md = """
-## Predict Delays
+ingest_predict_task.doc_md = """
+## Ingest and Predict
 
-This task runs the trained machine learning model to predict delay probabilities
-for all active shipments. Predictions are stored in the database for tracking.
+This task consumes real-time shipment updates from the Kafka topic 'shipment_updates',
+stores them in PostgreSQL (current shipment status and historical records), and runs
+the trained machine learning model to predict delay probabilities for all active
+shipments. Shipments updated in the consumed batch are scored directly from memory;
+the remaining active shipments are read back from the database. Predictions are
+stored in the database for tracking.
 """
 
 alert_task.doc_md = """
@@ -414,5 +660,6 @@ cleanup_task.doc_md = """
 ## Cleanup Old Data
 
 This task removes old historical data to prevent database bloat while maintaining
-recent data for analysis and reporting.
+recent data for analysis and reporting. Shipment history and predictions are
+partitioned by day, so expired days are dropped as whole partitions.
 """
\ No newline at end of file
@@ -1,3 +1,6 @@
+-- Schema for the docker-compose Postgres and db/init_db.py. It mirrors the state
+-- supabase/migrations leaves behind, so changes to one must be made in the other
+
 -- Create shipments table
 CREATE TABLE IF NOT EXISTS shipments (
     shipment_id VARCHAR(50) PRIMARY KEY,
@@ -14,16 +17,67 @@ CREATE TABLE IF NOT EXISTS shipments (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- shipment_history and delay_predictions are range-partitioned by day on created_at
+-- so that retention can drop whole partitions instead of running large DELETEs
+
+-- Creates the daily partition <parent_table>_YYYYMMDD if it does not exist yet.
+-- shipment_history partitions are created UNLOGGED: the history is an append-only
+-- audit trail rebuildable from Kafka, so it skips WAL and may be lost on a crash
+CREATE OR REPLACE FUNCTION create_daily_partition(
+    parent_table TEXT,
+    partition_day DATE,
+    unlogged BOOLEAN DEFAULT FALSE
+)
+RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT := parent_table || '_' || to_char(partition_day, 'YYYYMMDD');
+BEGIN
+    EXECUTE format(
+        'CREATE %s TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        CASE WHEN unlogged THEN 'UNLOGGED' ELSE '' END,
+        partition_name,
+        parent_table,
+        partition_day::timestamp AT TIME ZONE 'UTC',
+        (partition_day + 1)::timestamp AT TIME ZONE 'UTC'
+    );
+    RETURN partition_name;
+END;
+$$ language 'plpgsql';
+
+-- Create shipment_history table (one row per Kafka update, loaded by binary COPY,
+-- so the column types must match the types the pipeline sends)
+CREATE TABLE IF NOT EXISTS shipment_history (
+    id SERIAL,
+    shipment_id VARCHAR(50) REFERENCES shipments(shipment_id),
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    current_location VARCHAR(100),
+    distance_remaining_km INTEGER,
+    vehicle_speed_kmph DECIMAL(10,2),
+    weather VARCHAR(50),
+    traffic_level VARCHAR(50),
+    raw_data JSONB,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
 -- Create delay_predictions table
 CREATE TABLE IF NOT EXISTS delay_predictions (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     shipment_id VARCHAR(50) REFERENCES shipments(shipment_id),
-    delay_probability DECIMAL(5,4),
+    delay_probability DECIMAL(5,4) NOT NULL,
     predicted_delay_minutes INTEGER,
-    prediction_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    prediction_timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
     model_version VARCHAR(50),
-    features JSONB
-);
+    features JSONB,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Partitions for today and tomorrow; the pipeline creates later days as it runs
+SELECT create_daily_partition(parent_table, (NOW() AT TIME ZONE 'UTC')::date + day_offset, parent_table = 'shipment_history')
+FROM unnest(ARRAY['shipment_history', 'delay_predictions']) AS parent_table,
+     generate_series(0, 1) AS day_offset;
 
 -- Create alerts table
 CREATE TABLE IF NOT EXISTS alerts (
@@ -33,18 +87,60 @@ CREATE TABLE IF NOT EXISTS alerts (
     severity VARCHAR(20) NOT NULL,
     title VARCHAR(200) NOT NULL,
     message TEXT,
-    triggered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    is_active BOOLEAN DEFAULT TRUE,
-    resolved_at TIMESTAMP,
-    resolution_notes TEXT
+    triggered_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    resolved_at TIMESTAMP WITH TIME ZONE,
+    resolved_by VARCHAR(100),
+    resolution_notes TEXT,
+    metadata JSONB
 );
 
 -- Create indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_shipments_status ON shipments(status);
 CREATE INDEX IF NOT EXISTS idx_shipments_updated_at ON shipments(updated_at);
+-- Partial index matching the active-shipments predicate used by ingest_and_predict
+CREATE INDEX IF NOT EXISTS idx_shipments_active ON shipments(updated_at)
+    WHERE status IN ('In Transit', 'At Hub', 'Out for Delivery', 'Delayed') AND distance_remaining_km > 0;
+-- shipment_history and delay_predictions need no created_at index: retention drops
+-- whole partitions, and created_at range scans are answered by partition pruning
 CREATE INDEX IF NOT EXISTS idx_delay_predictions_shipment_timestamp ON delay_predictions(shipment_id, prediction_timestamp);
+CREATE INDEX IF NOT EXISTS idx_shipment_history_shipment_id ON shipment_history(shipment_id);
+CREATE INDEX IF NOT EXISTS idx_shipment_history_timestamp ON shipment_history(timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_delay_predictions_shipment_id ON delay_predictions(shipment_id);
+CREATE INDEX IF NOT EXISTS idx_delay_predictions_timestamp ON delay_predictions(prediction_timestamp);
+CREATE INDEX IF NOT EXISTS idx_delay_predictions_probability ON delay_predictions(delay_probability DESC);
 CREATE INDEX IF NOT EXISTS idx_alerts_triggered_at ON alerts(triggered_at);
 CREATE INDEX IF NOT EXISTS idx_alerts_is_active ON alerts(is_active);
+CREATE INDEX IF NOT EXISTS idx_dp_ship_ts ON delay_predictions(shipment_id, prediction_timestamp DESC)
+    INCLUDE (delay_probability, predicted_delay_minutes);
+CREATE INDEX IF NOT EXISTS idx_dp_ts_prob ON delay_predictions(prediction_timestamp DESC)
+    WHERE delay_probability >= 0.7;
+CREATE INDEX IF NOT EXISTS idx_alerts_active_ts ON alerts(triggered_at DESC) WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_alerts_dedup ON alerts(shipment_id, alert_type, triggered_at DESC)
+    WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_alerts_triggered_summary ON alerts(triggered_at DESC)
+    INCLUDE (severity, is_active, resolved_at);
+
+-- Notify listeners (the dashboard) once per statement that writes pipeline data
+CREATE OR REPLACE FUNCTION notify_pipeline_data_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('pipeline_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE TRIGGER notify_shipments_changed
+    AFTER INSERT OR UPDATE OR DELETE ON shipments
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_pipeline_data_changed();
+
+CREATE OR REPLACE TRIGGER notify_delay_predictions_changed
+    AFTER INSERT OR UPDATE OR DELETE ON delay_predictions
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_pipeline_data_changed();
+
+CREATE OR REPLACE TRIGGER notify_alerts_changed
+    AFTER INSERT OR UPDATE OR DELETE ON alerts
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_pipeline_data_changed();
 
 -- Insert some sample data
 INSERT INTO shipments (shipment_id, origin, destination, current_location, status, distance_remaining_km, vehicle_speed_kmph, weather, traffic_level, eta)
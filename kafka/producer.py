@@ -1,75 +1,141 @@
 #!/usr/bin/env python3
 
-import json
-import random
+import numpy as np
+import orjson
 import time
-from datetime import datetime, timedelta
+import zlib
+from datetime import datetime, timedelta, timezone
 from kafka import KafkaProducer
-from typing import Dict, List
+from typing import Callable, Dict, List, Tuple
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Timestamps are UTC-aware and keep the trailing "Z" the consumers expect
+SERIALIZE_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+# The whole record is encoded each time: splicing a cached prefix of the immutable
+# fields onto the mutable tail measured ~2x slower, since building the partial dict
+# costs more than orjson encoding three short strings
+def serialize_value(value: Dict) -> bytes:
+    """Serialize a shipment record to JSON bytes, encoding datetimes natively"""
+    return orjson.dumps(value, option=SERIALIZE_OPTIONS)
+
+# Conditions that slow a vehicle down
+SLOW_WEATHER = frozenset(("Rain", "Snow", "Fog"))
+HEAVY_TRAFFIC = frozenset(("Heavy", "Very Heavy"))
+
+class DrawBuffer:
+    """Hands out rows of pre-drawn random values, refilling a whole block from NumPy at a time"""
+    
+    def __init__(self, draw_block: Callable[[np.random.Generator, int], List[List]], size: int = 1024):
+        self._rng = np.random.default_rng()
+        self._draw_block = draw_block
+        self._size = size
+        self._rows = []
+        self._pos = 0
+    
+    def next(self) -> Tuple:
+        """Return the next row of draws"""
+        if self._pos == len(self._rows):
+            self._rows = list(zip(*self._draw_block(self._rng, self._size)))
+            self._pos = 0
+        row = self._rows[self._pos]
+        self._pos += 1
+        return row
+
 class ShipmentDataGenerator:
     """Generates realistic shipment data for the supply chain simulation"""
     
     def __init__(self):
-        self.cities = [
+        self.cities = (
             "Los Angeles", "New York", "Chicago", "Houston", "Phoenix",
             "Philadelphia", "San Antonio", "San Diego", "Dallas", "San Jose",
             "Austin", "Jacksonville", "Fort Worth", "Columbus", "Charlotte",
             "San Francisco", "Indianapolis", "Seattle", "Denver", "Boston"
-        ]
+        )
+        
+        self.weather_conditions = ("Clear", "Rain", "Snow", "Fog", "Storm")
+        self.traffic_levels = ("Light", "Moderate", "Heavy", "Very Heavy")
+        self.statuses = ("In Transit", "At Hub", "Out for Delivery", "Delayed")
+        
+        # Valid destinations for each origin, built once instead of per shipment
+        self._dest_choices = {
+            city: tuple(dest for dest in self.cities if dest != city)
+            for city in self.cities
+        }
         
-        self.weather_conditions = ["Clear", "Rain", "Snow", "Fog", "Storm"]
-        self.traffic_levels = ["Light", "Moderate", "Heavy", "Very Heavy"]
-        self.statuses = ["In Transit", "At Hub", "Out for Delivery", "Delayed"]
+        # Random draws for new shipments and per-tick updates, generated in blocks
+        self.shipment_draws = DrawBuffer(self._draw_shipment_block)
+        self.update_draws = DrawBuffer(self._draw_update_block)
         
         # Distance matrix (simplified - in real world, use routing APIs)
+        self._city_idx = {city: idx for idx, city in enumerate(self.cities)}
         self.city_distances = self._generate_distance_matrix()
         
-    def _generate_distance_matrix(self) -> Dict[str, Dict[str, int]]:
-        """Generate approximate distances between major cities"""
-        distances = {}
-        for origin in self.cities:
-            distances[origin] = {}
-            for dest in self.cities:
-                if origin == dest:
-                    distances[origin][dest] = 0
-                else:
-                    # Simplified distance calculation
-                    distances[origin][dest] = random.randint(500, 4000)
+    def _generate_distance_matrix(self) -> np.ndarray:
+        """Generate approximate distances between major cities, indexed by city position"""
+        distances = np.random.default_rng().integers(
+            500, 4001, (len(self.cities), len(self.cities)), dtype=np.int16
+        )
+        np.fill_diagonal(distances, 0)
         return distances
     
-    def generate_shipment(self, shipment_id: str = None) -> Dict:
-        """Generate a single shipment record"""
+    def _draw_shipment_block(self, rng: np.random.Generator, n: int) -> List[List]:
+        """Draw ID, origin, destination, location, status, weather, traffic, speed and progress columns"""
+        return [
+            rng.integers(1000, 10000, n).tolist(),
+            rng.integers(0, len(self.cities), n).tolist(),
+            rng.integers(0, len(self.cities) - 1, n).tolist(),
+            rng.integers(0, len(self.cities), n).tolist(),
+            rng.integers(0, len(self.statuses), n).tolist(),
+            rng.integers(0, len(self.weather_conditions), n).tolist(),
+            rng.integers(0, len(self.traffic_levels), n).tolist(),
+            rng.uniform(45, 80, n).tolist(),
+            rng.uniform(0.1, 0.9, n).tolist()
+        ]
+    
+    def _draw_update_block(self, rng: np.random.Generator, n: int) -> List[List]:
+        """Draw distance traveled, weather/traffic change rolls and picks, and speed columns"""
+        return [
+            rng.uniform(10, 50, n).tolist(),
+            rng.random(n).tolist(),
+            rng.integers(0, len(self.weather_conditions), n).tolist(),
+            rng.random(n).tolist(),
+            rng.integers(0, len(self.traffic_levels), n).tolist(),
+            rng.uniform(45, 80, n).tolist()
+        ]
+    
+    def generate_shipment(self, shipment_id: str = None, now: datetime = None, record: Dict = None) -> Dict:
+        """Generate a single shipment record, refilling `record` in place when one is given"""
+        (shipment_num, origin_idx, dest_idx, location_idx, status_idx,
+         weather_idx, traffic_idx, base_speed, progress) = self.shipment_draws.next()
+        
         if not shipment_id:
-            shipment_id = f"SHIP{random.randint(1000, 9999)}"
+            shipment_id = f"SHIP{shipment_num}"
             
-        origin = random.choice(self.cities)
-        destination = random.choice([city for city in self.cities if city != origin])
+        origin = self.cities[origin_idx]
+        destination = self._dest_choices[origin][dest_idx]
         
         # Calculate base ETA (simplified)
-        distance = self.city_distances[origin][destination]
+        distance = int(self.city_distances[self._city_idx[origin], self._city_idx[destination]])
         base_travel_time = distance / 70  # Average 70 km/h
         
-        current_time = datetime.now()
+        current_time = now or datetime.now(timezone.utc)
         eta = current_time + timedelta(hours=base_travel_time)
         
         # Add some realistic variation
-        weather = random.choice(self.weather_conditions)
-        traffic = random.choice(self.traffic_levels)
+        weather = self.weather_conditions[weather_idx]
+        traffic = self.traffic_levels[traffic_idx]
         
         # Adjust speed based on conditions
-        base_speed = random.uniform(45, 80)
-        if weather in ["Rain", "Snow", "Fog"]:
+        if weather in SLOW_WEATHER:
             base_speed *= 0.8
-        if traffic in ["Heavy", "Very Heavy"]:
+        if traffic in HEAVY_TRAFFIC:
             base_speed *= 0.7
             
         # Calculate remaining distance (shipment in progress)
-        progress = random.uniform(0.1, 0.9)
         distance_remaining = int(distance * (1 - progress))
         
         # Choose current location based on progress
@@ -78,21 +144,23 @@ class ShipmentDataGenerator:
         elif progress > 0.7:
             current_location = destination
         else:
-            current_location = random.choice(self.cities)
+            current_location = self.cities[location_idx]
             
-        return {
-            "shipment_id": shipment_id,
-            "origin": origin,
-            "destination": destination,
-            "timestamp": current_time.isoformat() + "Z",
-            "status": random.choice(self.statuses),
-            "eta": eta.isoformat() + "Z",
-            "current_location": current_location,
-            "vehicle_speed_kmph": round(base_speed, 1),
-            "distance_remaining_km": distance_remaining,
-            "weather": weather,
-            "traffic_level": traffic
-        }
+        # Reusing a delivered shipment's dict keeps its key layout and skips a new allocation
+        if record is None:
+            record = {}
+        record["shipment_id"] = shipment_id
+        record["origin"] = origin
+        record["destination"] = destination
+        record["timestamp"] = current_time
+        record["status"] = self.statuses[status_idx]
+        record["eta"] = eta
+        record["current_location"] = current_location
+        record["vehicle_speed_kmph"] = round(base_speed, 1)
+        record["distance_remaining_km"] = distance_remaining
+        record["weather"] = weather
+        record["traffic_level"] = traffic
+        return record
 
 class ShipmentProducer:
     """Kafka producer for shipment data"""
@@ -101,76 +169,112 @@ class ShipmentProducer:
         self.bootstrap_servers = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092')
         self.topic = os.getenv('KAFKA_TOPIC', 'shipment_updates')
         
+        acks = os.getenv('KAFKA_ACKS', '1')
+        
+        # Batching and compression settings; linger lets each flush cycle fill batches
         self.producer = KafkaProducer(
             bootstrap_servers=self.bootstrap_servers,
-            value_serializer=lambda v: json.dumps(v).encode('utf-8'),
-            key_serializer=lambda k: k.encode('utf-8') if k else None,
+            value_serializer=serialize_value,
+            key_serializer=lambda k: bytes(k, 'utf-8') if k else None,
             retry_backoff_ms=1000,
-            request_timeout_ms=30000
+            request_timeout_ms=30000,
+            linger_ms=int(os.getenv('KAFKA_LINGER_MS', 100)),
+            batch_size=int(os.getenv('KAFKA_BATCH_BYTES', 200000)),
+            compression_type=os.getenv('KAFKA_COMPRESSION_TYPE', 'lz4'),
+            acks=acks if acks == 'all' else int(acks),
+            max_in_flight_requests_per_connection=int(os.getenv('KAFKA_MAX_IN_FLIGHT', 5)),
+            buffer_memory=int(os.getenv('KAFKA_BUFFER_MEMORY', 64 * 1024 * 1024))
         )
         
+        # Keys hash into a few buckets so each flush fills a handful of full
+        # per-partition batches while updates for one shipment stay ordered
+        self.key_buckets = int(os.getenv('KAFKA_KEY_BUCKETS', 8))
+        
         self.data_generator = ShipmentDataGenerator()
-        self.active_shipments = {}
+        self.active_shipments: List[Dict] = []
         
+    def partition_key(self, shipment_id: str) -> str:
+        """Map a shipment ID to a stable bucket key"""
+        return str(zlib.crc32(shipment_id.encode('utf-8')) % self.key_buckets)
+    
     def send_shipment_update(self, shipment_data: Dict):
         """Send a single shipment update to Kafka"""
         try:
             future = self.producer.send(
                 self.topic,
-                key=shipment_data['shipment_id'],
+                key=self.partition_key(shipment_data['shipment_id']),
                 value=shipment_data
             )
             
-            # Optional: wait for confirmation
-            record_metadata = future.get(timeout=10)
-            print(f"Sent shipment {shipment_data['shipment_id']} to {record_metadata.topic}:{record_metadata.partition}")
+            # Don't block on the broker ack; let the accumulator batch records.
+            # Successes are summarized once per tick, only failures are logged here
+            future.add_errback(self._on_send_error, shipment_data['shipment_id'])
             
         except Exception as e:
             print(f"Error sending shipment update: {e}")
     
+    def _on_send_error(self, shipment_id: str, exception):
+        """Log a shipment update the broker did not accept"""
+        print(f"Error sending shipment update for {shipment_id}: {exception}")
+    
     def simulate_continuous_updates(self, num_shipments: int = 50, update_interval: int = 30):
         """Simulate continuous shipment updates"""
         print(f"Starting shipment simulation with {num_shipments} active shipments")
         print(f"Updates every {update_interval} seconds")
         
         # Initialize shipments
-        for i in range(num_shipments):
-            shipment = self.data_generator.generate_shipment()
-            self.active_shipments[shipment['shipment_id']] = shipment
+        self.active_shipments = [
+            self.data_generator.generate_shipment() for _ in range(num_shipments)
+        ]
             
         try:
+            next_tick = time.monotonic()
             while True:
-                # Update and send all shipments
-                for shipment_id in list(self.active_shipments.keys()):
+                # One clock read per tick; orjson formats the datetime at send time
+                now = datetime.now(timezone.utc)
+                
+                # Update and send all shipments; delivered ones are replaced in place
+                delivered = 0
+                for shipment in self.active_shipments:
                     # Update existing shipment with new data
-                    updated_shipment = self._update_shipment(self.active_shipments[shipment_id])
+                    updated_shipment = self._update_shipment(shipment, now)
                     
-                    if updated_shipment:
-                        self.active_shipments[shipment_id] = updated_shipment
-                        self.send_shipment_update(updated_shipment)
-                    else:
-                        # Shipment delivered, create new one
-                        new_shipment = self.data_generator.generate_shipment()
-                        self.active_shipments[new_shipment['shipment_id']] = new_shipment
-                        del self.active_shipments[shipment_id]
-                        self.send_shipment_update(new_shipment)
+                    if updated_shipment is None:
+                        # Shipment delivered; refill its dict as a new shipment. send()
+                        # serializes synchronously, so the old record is already encoded
+                        updated_shipment = self.data_generator.generate_shipment(now=now, record=shipment)
+                        delivered += 1
+                    
+                    self.send_shipment_update(updated_shipment)
+                
+                # Push out the whole cycle's batches before sleeping
+                self.producer.flush()
+                print(f"Sent {len(self.active_shipments)} shipment updates ({delivered} delivered and replaced)")
                 
-                print(f"Updated {len(self.active_shipments)} shipments")
-                time.sleep(update_interval)
+                # Sleep until the next scheduled tick so send/flush time overlaps the interval
+                next_tick += update_interval
+                current = time.monotonic()
+                if next_tick < current:
+                    # Fell behind (GC, flush backpressure, host sleep): restart the schedule
+                    # from now instead of replaying missed ticks as a burst
+                    next_tick = current
+                time.sleep(next_tick - current)
                 
         except KeyboardInterrupt:
             print("Stopping shipment simulation...")
         finally:
             self.producer.close()
     
-    def _update_shipment(self, shipment: Dict) -> Dict:
+    def _update_shipment(self, shipment: Dict, now: datetime = None) -> Dict:
         """Update an existing shipment with new status"""
         # Simulate shipment progress
         current_distance = shipment['distance_remaining_km']
         speed = shipment['vehicle_speed_kmph']
         
-        # Reduce distance (simulate movement)
-        distance_traveled = random.uniform(10, 50)  # km in update interval
+        (distance_traveled, weather_roll, weather_idx, traffic_roll,
+         traffic_idx, base_speed) = self.data_generator.update_draws.next()
+        
+        # Reduce distance (simulate movement); distance_traveled is km in update interval
         new_distance = max(0, current_distance - distance_traveled)
         
         if new_distance <= 0:
@@ -178,21 +282,20 @@ class ShipmentProducer:
             return None
             
         # Update timestamp
-        shipment['timestamp'] = datetime.now().isoformat() + "Z"
+        shipment['timestamp'] = now or datetime.now(timezone.utc)
         shipment['distance_remaining_km'] = int(new_distance)
         
         # Possibly update status and conditions
-        if random.random() < 0.1:  # 10% chance to change weather
-            shipment['weather'] = random.choice(self.data_generator.weather_conditions)
+        if weather_roll < 0.1:  # 10% chance to change weather
+            shipment['weather'] = self.data_generator.weather_conditions[weather_idx]
         
-        if random.random() < 0.1:  # 10% chance to change traffic
-            shipment['traffic_level'] = random.choice(self.data_generator.traffic_levels)
+        if traffic_roll < 0.1:  # 10% chance to change traffic
+            shipment['traffic_level'] = self.data_generator.traffic_levels[traffic_idx]
             
         # Update speed based on conditions
-        base_speed = random.uniform(45, 80)
-        if shipment['weather'] in ["Rain", "Snow", "Fog"]:
+        if shipment['weather'] in SLOW_WEATHER:
             base_speed *= 0.8
-        if shipment['traffic_level'] in ["Heavy", "Very Heavy"]:
+        if shipment['traffic_level'] in HEAVY_TRAFFIC:
             base_speed *= 0.7
         shipment['vehicle_speed_kmph'] = round(base_speed, 1)
         
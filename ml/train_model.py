@@ -2,13 +2,14 @@
 
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV
-from sklearn.preprocessing import LabelEncoder, StandardScaler
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.inspection import permutation_importance
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score
 import joblib
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import psycopg2
 from dotenv import load_dotenv
 import warnings
@@ -22,7 +23,7 @@ class DelayPredictor:
     def __init__(self):
         self.model = None
         self.feature_encoders = {}
-        self.scaler = StandardScaler()
+        self.scaler = None  # Tree models are scale-invariant; kept in the artifact for compatibility
         self.feature_columns = [
             'distance_remaining_km',
             'vehicle_speed_kmph',
@@ -83,82 +84,79 @@ class DelayPredictor:
     
     def _generate_synthetic_training_data(self, n_samples=5000):
         """Generate synthetic training data for initial model training"""
-        np.random.seed(42)
+        rng = np.random.default_rng(42)
         
-        cities = [
+        cities = np.array([
             "Los Angeles", "New York", "Chicago", "Houston", "Phoenix",
             "Philadelphia", "San Antonio", "San Diego", "Dallas", "San Jose",
             "Austin", "Jacksonville", "Fort Worth", "Columbus", "Charlotte"
-        ]
+        ])
         
-        weather_conditions = ["Clear", "Rain", "Snow", "Fog", "Storm"]
-        traffic_levels = ["Light", "Moderate", "Heavy", "Very Heavy"]
+        weather_conditions = np.array(["Clear", "Rain", "Snow", "Fog", "Storm"])
+        traffic_levels = np.array(["Light", "Moderate", "Heavy", "Very Heavy"])
         
-        data = []
+        # Basic features
+        distance = rng.integers(100, 4000, n_samples)
+        base_speed = rng.uniform(40, 80, n_samples)
+        weather = weather_conditions[rng.integers(0, len(weather_conditions), n_samples)]
+        traffic = traffic_levels[rng.integers(0, len(traffic_levels), n_samples)]
         
-        for i in range(n_samples):
-            # Basic features
-            distance = np.random.randint(100, 4000)
-            base_speed = np.random.uniform(40, 80)
-            weather = np.random.choice(weather_conditions)
-            traffic = np.random.choice(traffic_levels)
-            
-            # Adjust speed based on conditions
-            if weather in ["Rain", "Snow", "Fog"]:
-                base_speed *= np.random.uniform(0.6, 0.9)
-            if weather == "Storm":
-                base_speed *= np.random.uniform(0.4, 0.7)
-            if traffic in ["Heavy", "Very Heavy"]:
-                base_speed *= np.random.uniform(0.5, 0.8)
-            
-            # Time features
-            timestamp = datetime.now() - timedelta(days=np.random.randint(1, 365))
-            
-            # Calculate delay probability based on conditions
-            delay_factors = 0
-            
-            if distance > 2000:
-                delay_factors += 0.2
-            if base_speed < 50:
-                delay_factors += 0.3
-            if weather in ["Rain", "Snow", "Storm"]:
-                delay_factors += 0.25
-            if traffic in ["Heavy", "Very Heavy"]:
-                delay_factors += 0.2
-            if timestamp.hour in [6, 7, 8, 17, 18, 19]:  # Rush hours
-                delay_factors += 0.15
-            
-            # Add some randomness
-            delay_probability = min(delay_factors + np.random.uniform(-0.1, 0.1), 0.9)
-            is_delayed = 1 if np.random.random() < delay_probability else 0
-            
-            data.append({
-                'shipment_id': f'SYNTH_{i:06d}',
-                'origin': np.random.choice(cities),
-                'destination': np.random.choice(cities),
-                'distance_remaining_km': distance,
-                'vehicle_speed_kmph': round(base_speed, 1),
-                'weather': weather,
-                'traffic_level': traffic,
-                'timestamp': timestamp,
-                'eta': timestamp + timedelta(hours=distance/base_speed),
-                'updated_at': timestamp + timedelta(hours=distance/base_speed + (2 if is_delayed else 0)),
-                'is_delayed': is_delayed
-            })
-        
-        return pd.DataFrame(data)
+        # Adjust speed based on conditions
+        reduced_visibility = np.isin(weather, ["Rain", "Snow", "Fog"])
+        storm = weather == "Storm"
+        heavy_traffic = np.isin(traffic, ["Heavy", "Very Heavy"])
+        
+        base_speed *= np.where(reduced_visibility, rng.uniform(0.6, 0.9, n_samples), 1.0)
+        base_speed *= np.where(storm, rng.uniform(0.4, 0.7, n_samples), 1.0)
+        base_speed *= np.where(heavy_traffic, rng.uniform(0.5, 0.8, n_samples), 1.0)
+        
+        # Time features
+        timestamp = pd.Timestamp(datetime.now()) - pd.to_timedelta(
+            rng.integers(1, 365, n_samples), unit='D'
+        )
+        
+        # Calculate delay probability based on conditions
+        delay_factors = (
+            np.where(distance > 2000, 0.2, 0.0)
+            + np.where(base_speed < 50, 0.3, 0.0)
+            + np.where(np.isin(weather, ["Rain", "Snow", "Storm"]), 0.25, 0.0)
+            + np.where(heavy_traffic, 0.2, 0.0)
+            + np.where(np.isin(timestamp.hour, [6, 7, 8, 17, 18, 19]), 0.15, 0.0)  # Rush hours
+        )
+        
+        # Add some randomness
+        delay_probability = np.minimum(delay_factors + rng.uniform(-0.1, 0.1, n_samples), 0.9)
+        is_delayed = (rng.random(n_samples) < delay_probability).astype(np.int64)
+        
+        travel_time = pd.to_timedelta(distance / base_speed, unit='h')
+        
+        return pd.DataFrame({
+            'shipment_id': [f'SYNTH_{i:06d}' for i in range(n_samples)],
+            'origin': cities[rng.integers(0, len(cities), n_samples)],
+            'destination': cities[rng.integers(0, len(cities), n_samples)],
+            'distance_remaining_km': distance,
+            'vehicle_speed_kmph': base_speed.round(1),
+            'weather': weather,
+            'traffic_level': traffic,
+            'timestamp': timestamp,
+            'eta': timestamp + travel_time,
+            'updated_at': timestamp + travel_time + pd.to_timedelta(is_delayed * 2, unit='h'),
+            'is_delayed': is_delayed
+        })
     
     def engineer_features(self, df):
         """Create engineered features from raw data"""
         df = df.copy()
         
-        # Encode categorical variables
+        # Encode categorical variables; sorted categories give the same codes as
+        # the LabelEncoder, which is kept in the artifact for inference
         for col in ['weather', 'traffic_level']:
             if col not in self.feature_encoders:
-                self.feature_encoders[col] = LabelEncoder()
-                df[f'{col}_encoded'] = self.feature_encoders[col].fit_transform(df[col])
+                df[col] = df[col].astype('category')
+                self.feature_encoders[col] = LabelEncoder().fit(df[col].cat.categories)
             else:
-                df[f'{col}_encoded'] = self.feature_encoders[col].transform(df[col])
+                df[col] = pd.Categorical(df[col], categories=self.feature_encoders[col].classes_)
+            df[f'{col}_encoded'] = df[col].cat.codes.astype(np.int8)
         
         # Time-based features
         df['timestamp'] = pd.to_datetime(df['timestamp'])
@@ -170,12 +168,8 @@ class DelayPredictor:
         origin_counts = df['origin'].value_counts()
         destination_counts = df['destination'].value_counts()
         
-        df['origin_risk_score'] = df['origin'].map(
-            lambda x: origin_counts.get(x, 1) / len(df)
-        )
-        df['destination_risk_score'] = df['destination'].map(
-            lambda x: destination_counts.get(x, 1) / len(df)
-        )
+        df['origin_risk_score'] = df['origin'].map(origin_counts).astype(np.float32) / len(df)
+        df['destination_risk_score'] = df['destination'].map(destination_counts).astype(np.float32) / len(df)
         
         # Route complexity based on distance and speed
         df['route_complexity'] = (
@@ -190,7 +184,7 @@ class DelayPredictor:
         df_features = self.engineer_features(df)
         
         # Prepare features and target
-        X = df_features[self.feature_columns]
+        X = df_features[self.feature_columns].astype(np.float32)
         y = df_features['is_delayed']
         
         print(f"Training data shape: {X.shape}")
@@ -201,48 +195,45 @@ class DelayPredictor:
             X, y, test_size=0.2, random_state=42, stratify=y
         )
         
-        # Scale features
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
-        
-        # Train model with hyperparameter tuning
-        print("Training Random Forest model...")
-        
-        param_grid = {
-            'n_estimators': [100, 200],
-            'max_depth': [10, 15, 20],
-            'min_samples_split': [5, 10],
-            'min_samples_leaf': [2, 4]
-        }
-        
-        rf = RandomForestClassifier(random_state=42)
-        grid_search = GridSearchCV(
-            rf, param_grid, cv=5, scoring='roc_auc', n_jobs=-1
+        # No scaling: tree splits only depend on feature order
+        X_train = X_train.to_numpy()
+        X_test = X_test.to_numpy()
+        
+        # Histogram-based boosting; early stopping on a held-out slice of the
+        # training split picks the number of trees instead of a grid search
+        print("Training gradient boosting model...")
+        
+        self.model = HistGradientBoostingClassifier(
+            max_iter=500,
+            learning_rate=0.05,
+            max_leaf_nodes=63,
+            early_stopping=True,
+            validation_fraction=0.2,
+            n_iter_no_change=30,
+            scoring='roc_auc',
+            random_state=42
         )
-        
-        grid_search.fit(X_train_scaled, y_train)
-        self.model = grid_search.best_estimator_
+        self.model.fit(X_train, y_train)
         
         # Evaluate model
         print("\n=== Model Evaluation ===")
-        print(f"Best parameters: {grid_search.best_params_}")
-        
-        # Cross-validation scores
-        cv_scores = cross_val_score(self.model, X_train_scaled, y_train, cv=5, scoring='roc_auc')
-        print(f"Cross-validation AUC: {cv_scores.mean():.3f} (+/- {cv_scores.std() * 2:.3f})")
+        print(f"Boosting iterations: {self.model.n_iter_}")
         
         # Test set evaluation
-        y_pred = self.model.predict(X_test_scaled)
-        y_pred_proba = self.model.predict_proba(X_test_scaled)[:, 1]
+        y_pred = self.model.predict(X_test)
+        y_pred_proba = self.model.predict_proba(X_test)[:, 1]
         
         print(f"Test AUC: {roc_auc_score(y_test, y_pred_proba):.3f}")
         print("\nClassification Report:")
         print(classification_report(y_test, y_pred))
         
-        # Feature importance
+        # Feature importance (boosted trees don't expose impurity importances)
+        importances = permutation_importance(
+            self.model, X_test, y_test, scoring='roc_auc', n_repeats=5, random_state=42
+        )
         feature_importance = pd.DataFrame({
             'feature': self.feature_columns,
-            'importance': self.model.feature_importances_
+            'importance': importances.importances_mean
         }).sort_values('importance', ascending=False)
         
         print("\nFeature Importance:")
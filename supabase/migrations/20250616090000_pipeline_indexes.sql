@@ -0,0 +1,14 @@
+-- Indexes for the delay prediction pipeline hot queries
+
+-- Partial index matching the active-shipments predicate used by ingest_and_predict
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_shipments_active
+    ON shipments(updated_at)
+    WHERE status IN ('In Transit', 'At Hub', 'Out for Delivery', 'Delayed')
+    AND distance_remaining_km > 0;
+
+-- Range indexes for the retention DELETEs in cleanup_old_data
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_shipment_history_created_at
+    ON shipment_history(created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_delay_predictions_created_at
+    ON delay_predictions(created_at);
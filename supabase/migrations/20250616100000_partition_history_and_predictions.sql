@@ -0,0 +1,122 @@
+-- Range-partition shipment_history and delay_predictions by day on created_at
+-- so that retention can drop whole partitions instead of running large DELETEs
+
+-- Creates the daily partition <parent_table>_YYYYMMDD if it does not exist yet
+CREATE OR REPLACE FUNCTION create_daily_partition(parent_table TEXT, partition_day DATE)
+RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT := parent_table || '_' || to_char(partition_day, 'YYYYMMDD');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        parent_table,
+        partition_day::timestamp AT TIME ZONE 'UTC',
+        (partition_day + 1)::timestamp AT TIME ZONE 'UTC'
+    );
+    RETURN partition_name;
+END;
+$$ language 'plpgsql';
+
+-- active_shipments reads delay_predictions and would follow the renamed table
+-- (and block dropping it), so it is recreated once the data has been moved
+DROP VIEW IF EXISTS active_shipments;
+
+-- Shipment history
+ALTER TABLE shipment_history RENAME TO shipment_history_legacy;
+
+CREATE TABLE shipment_history (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    shipment_id VARCHAR(50) NOT NULL,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+    status shipment_status NOT NULL,
+    current_location VARCHAR(100),
+    distance_remaining_km INTEGER,
+    vehicle_speed_kmph DECIMAL(5,2),
+    weather weather_condition,
+    traffic_level traffic_level,
+    raw_data JSONB,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (shipment_id) REFERENCES shipments(shipment_id) ON DELETE CASCADE
+) PARTITION BY RANGE (created_at);
+
+-- Delay predictions
+ALTER TABLE delay_predictions RENAME TO delay_predictions_legacy;
+
+-- Index names stay with the renamed tables; free them up so the indexes below
+-- are created on the new parents instead of being skipped by IF NOT EXISTS
+ALTER INDEX IF EXISTS idx_shipment_history_shipment_id RENAME TO idx_shipment_history_shipment_id_legacy;
+ALTER INDEX IF EXISTS idx_shipment_history_timestamp RENAME TO idx_shipment_history_timestamp_legacy;
+ALTER INDEX IF EXISTS idx_shipment_history_created_at RENAME TO idx_shipment_history_created_at_legacy;
+ALTER INDEX IF EXISTS idx_delay_predictions_shipment_id RENAME TO idx_delay_predictions_shipment_id_legacy;
+ALTER INDEX IF EXISTS idx_delay_predictions_timestamp RENAME TO idx_delay_predictions_timestamp_legacy;
+ALTER INDEX IF EXISTS idx_delay_predictions_probability RENAME TO idx_delay_predictions_probability_legacy;
+ALTER INDEX IF EXISTS idx_delay_predictions_created_at RENAME TO idx_delay_predictions_created_at_legacy;
+
+CREATE TABLE delay_predictions (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    shipment_id VARCHAR(50) NOT NULL,
+    prediction_timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    delay_probability DECIMAL(5,4) NOT NULL,
+    predicted_delay_minutes INTEGER,
+    model_version VARCHAR(50),
+    features JSONB,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (shipment_id) REFERENCES shipments(shipment_id) ON DELETE CASCADE
+) PARTITION BY RANGE (created_at);
+
+-- Create partitions covering the existing rows plus the next day
+DO $$
+DECLARE
+    first_day DATE;
+    partition_day DATE;
+BEGIN
+    SELECT LEAST(
+        (SELECT MIN(created_at) FROM shipment_history_legacy),
+        (SELECT MIN(created_at) FROM delay_predictions_legacy),
+        NOW()
+    ) AT TIME ZONE 'UTC' INTO first_day;
+
+    FOR partition_day IN
+        SELECT generate_series(first_day, (NOW() AT TIME ZONE 'UTC')::date + 1, INTERVAL '1 day')::date
+    LOOP
+        PERFORM create_daily_partition('shipment_history', partition_day);
+        PERFORM create_daily_partition('delay_predictions', partition_day);
+    END LOOP;
+END;
+$$;
+
+INSERT INTO shipment_history SELECT * FROM shipment_history_legacy;
+INSERT INTO delay_predictions SELECT * FROM delay_predictions_legacy;
+
+DROP TABLE shipment_history_legacy;
+DROP TABLE delay_predictions_legacy;
+
+CREATE OR REPLACE VIEW active_shipments AS
+SELECT 
+    s.*,
+    dp.delay_probability,
+    dp.predicted_delay_minutes,
+    CASE 
+        WHEN dp.delay_probability >= 0.7 THEN 'High Risk'
+        WHEN dp.delay_probability >= 0.4 THEN 'Medium Risk'
+        ELSE 'Low Risk'
+    END as risk_level
+FROM shipments s
+LEFT JOIN LATERAL (
+    SELECT delay_probability, predicted_delay_minutes
+    FROM delay_predictions dp2
+    WHERE dp2.shipment_id = s.shipment_id
+    ORDER BY dp2.prediction_timestamp DESC
+    LIMIT 1
+) dp ON true
+WHERE s.status IN ('In Transit', 'At Hub', 'Out for Delivery', 'Delayed');
+
+-- Indexes are created on the parents and cascade to every partition
+CREATE INDEX IF NOT EXISTS idx_shipment_history_shipment_id ON shipment_history(shipment_id);
+CREATE INDEX IF NOT EXISTS idx_shipment_history_timestamp ON shipment_history(timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_delay_predictions_shipment_id ON delay_predictions(shipment_id);
+CREATE INDEX IF NOT EXISTS idx_delay_predictions_timestamp ON delay_predictions(prediction_timestamp);
+CREATE INDEX IF NOT EXISTS idx_delay_predictions_probability ON delay_predictions(delay_probability DESC);
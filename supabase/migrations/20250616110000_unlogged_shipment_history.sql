@@ -0,0 +1,49 @@
+-- Make shipment_history partitions UNLOGGED to take WAL writes off the hottest
+-- ingestion path.
+--
+-- Tradeoff: unlogged tables are truncated after a crash or unclean shutdown and
+-- are not replicated to standbys. shipment_history is an append-only audit trail
+-- of Kafka updates (the source of truth stays in Kafka and the current state in
+-- shipments), so losing it on a crash is acceptable. Partitioned parents cannot be
+-- unlogged themselves, so the setting is applied to every daily partition.
+
+DROP FUNCTION IF EXISTS create_daily_partition(TEXT, DATE);
+
+-- Creates the daily partition <parent_table>_YYYYMMDD if it does not exist yet
+CREATE OR REPLACE FUNCTION create_daily_partition(
+    parent_table TEXT,
+    partition_day DATE,
+    unlogged BOOLEAN DEFAULT FALSE
+)
+RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT := parent_table || '_' || to_char(partition_day, 'YYYYMMDD');
+BEGIN
+    EXECUTE format(
+        'CREATE %s TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        CASE WHEN unlogged THEN 'UNLOGGED' ELSE '' END,
+        partition_name,
+        parent_table,
+        partition_day::timestamp AT TIME ZONE 'UTC',
+        (partition_day + 1)::timestamp AT TIME ZONE 'UTC'
+    );
+    RETURN partition_name;
+END;
+$$ language 'plpgsql';
+
+-- Switch the existing history partitions over
+DO $$
+DECLARE
+    partition_name TEXT;
+BEGIN
+    FOR partition_name IN
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = 'shipment_history'
+    LOOP
+        EXECUTE format('ALTER TABLE %I SET UNLOGGED', partition_name);
+    END LOOP;
+END;
+$$;
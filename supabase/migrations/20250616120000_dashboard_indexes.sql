@@ -0,0 +1,17 @@
+-- Indexes for the dashboard hot queries
+
+-- Covering index for the latest-prediction-per-shipment DISTINCT ON, so it can
+-- be answered with an index-only scan
+CREATE INDEX IF NOT EXISTS idx_dp_ship_ts
+    ON delay_predictions(shipment_id, prediction_timestamp DESC)
+    INCLUDE (delay_probability, predicted_delay_minutes);
+
+-- Partial index for the high-risk predictions metric
+CREATE INDEX IF NOT EXISTS idx_dp_ts_prob
+    ON delay_predictions(prediction_timestamp DESC)
+    WHERE delay_probability >= 0.7;
+
+-- Active alerts ordered by recency
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_alerts_active_ts
+    ON alerts(triggered_at DESC)
+    WHERE is_active;
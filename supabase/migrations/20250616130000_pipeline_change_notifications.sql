@@ -0,0 +1,20 @@
+-- Notify listeners (the dashboard) once per statement that writes pipeline data
+CREATE OR REPLACE FUNCTION notify_pipeline_data_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('pipeline_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE TRIGGER notify_shipments_changed
+    AFTER INSERT OR UPDATE OR DELETE ON shipments
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_pipeline_data_changed();
+
+CREATE OR REPLACE TRIGGER notify_delay_predictions_changed
+    AFTER INSERT OR UPDATE OR DELETE ON delay_predictions
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_pipeline_data_changed();
+
+CREATE OR REPLACE TRIGGER notify_alerts_changed
+    AFTER INSERT OR UPDATE OR DELETE ON alerts
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_pipeline_data_changed();
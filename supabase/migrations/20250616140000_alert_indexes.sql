@@ -0,0 +1,13 @@
+-- Indexes for the AlertManager queries
+
+-- Active-alert dedup lookup by shipment and type, newest first, so the
+-- "similar alert in the window" check reads a single index entry
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_alerts_dedup
+    ON alerts(shipment_id, alert_type, triggered_at DESC)
+    WHERE is_active;
+
+-- Covering index for the alert summary, so the time-window aggregate can be
+-- answered with an index-only scan
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_alerts_triggered_summary
+    ON alerts(triggered_at DESC)
+    INCLUDE (severity, is_active, resolved_at);
@@ -79,9 +79,19 @@ class TestShipmentProducer(unittest.TestCase):
         # Verify producer was called
         self.mock_producer.send.assert_called_once_with(
             'shipment_updates',
-            key='TEST001',
+            key=self.producer.partition_key('TEST001'),
             value=test_shipment
         )
 
+    def test_partition_key_buckets(self):
+        """Test that shipment keys map to a stable, bounded set of buckets"""
+        keys = {self.producer.partition_key(f"SHIP{i}") for i in range(1000, 10000)}
+        
+        self.assertLessEqual(len(keys), self.producer.key_buckets)
+        self.assertEqual(
+            self.producer.partition_key('TEST001'),
+            self.producer.partition_key('TEST001')
+        )
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
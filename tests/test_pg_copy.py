@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import unittest
+import struct
+from datetime import datetime, timedelta, timezone
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.pg_copy import (
+    COPY_HEADER, COPY_TRAILER, encode_binary_copy, _encode_numeric, _encode_timestamp, _encode_timestamptz
+)
+
+class TestBinaryCopy(unittest.TestCase):
+    
+    def test_numeric_encoding(self):
+        """Test numeric values are split into base-10000 digit groups"""
+        # ndigits, weight, sign, dscale, digits...
+        self.assertEqual(_encode_numeric(45.5), struct.pack('!hhHhhh', 2, 0, 0, 1, 45, 5000))
+        self.assertEqual(_encode_numeric(12345.678), struct.pack('!hhHhhhh', 3, 1, 0, 3, 1, 2345, 6780))
+        self.assertEqual(_encode_numeric(-0.001), struct.pack('!hhHhh', 1, -1, 0x4000, 3, 10))
+        self.assertEqual(_encode_numeric(0), struct.pack('!hhHh', 0, 0, 0, 0))
+    
+    def test_timestamptz_encoding(self):
+        """Test timestamps are encoded relative to the PostgreSQL epoch"""
+        epoch = datetime(2000, 1, 1, tzinfo=timezone.utc)
+        self.assertEqual(_encode_timestamptz(epoch), struct.pack('!q', 0))
+        self.assertEqual(
+            _encode_timestamptz(datetime(2000, 1, 2, 0, 0, 1)),
+            struct.pack('!q', 86_401_000_000)
+        )
+        
+        # Timestamps without time zone keep the wall clock of aware values
+        eastern = timezone(timedelta(hours=-5))
+        self.assertEqual(
+            _encode_timestamp(datetime(2000, 1, 2, 0, 0, 1, tzinfo=eastern)),
+            struct.pack('!q', 86_401_000_000)
+        )
+    
+    def test_encode_rows(self):
+        """Test row framing, including NULL fields"""
+        buffer = encode_binary_copy([('SH1', 42, None)], ['text', 'int4', 'text'])
+        
+        expected = (
+            COPY_HEADER
+            + struct.pack('!h', 3)
+            + struct.pack('!i', 3) + b'SH1'
+            + struct.pack('!i', 4) + struct.pack('!i', 42)
+            + struct.pack('!i', -1)
+            + COPY_TRAILER
+        )
+        self.assertEqual(buffer.getvalue(), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,80 +1,221 @@
 #!/usr/bin/env python3
 
+import copy
 import os
-import json
-from datetime import datetime
+import queue
+import ssl
+import threading
+import time
+from contextlib import contextmanager
 from typing import Dict, List, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+import orjson
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Window in which a repeat alert for the same shipment and type is suppressed
+ALERT_DEDUP_MINUTES = int(os.getenv('ALERT_DEDUP_MINUTES', 60))
+
+# How long dashboard-style reads may be served from memory
+ACTIVE_ALERTS_CACHE_TTL = float(os.getenv('ACTIVE_ALERTS_CACHE_TTL', 5))
+ALERT_SUMMARY_CACHE_TTL = float(os.getenv('ALERT_SUMMARY_CACHE_TTL', 30))
+
+SEVERITY_RANK = {'Low': 1, 'Medium': 2, 'High': 3, 'Critical': 4}
+
+def metadata_json(alert_data: Dict) -> str:
+    """Alert metadata as JSON text, reusing a pre-encoded `metadata_json` when the caller has one"""
+    encoded = alert_data.get('metadata_json')
+    if encoded is not None:
+        return encoded
+    return orjson.dumps(alert_data.get('metadata', {})).decode()
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` calls per second"""
+    
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a token is available and consume it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
+            
+            time.sleep(wait)
+
+class TTLCache:
+    """Thread-safe cache whose entries expire after a per-entry number of seconds"""
+    
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+            return entry[1]
+    
+    def set(self, key, value, ttl: float):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
 class AlertManager:
     """Manages alert creation, notification, and tracking"""
     
+    SEVERITY_EMOJI = {
+        'Low': '🟡',
+        'Medium': '🟠',
+        'High': '🔴',
+        'Critical': '🚨'
+    }
+    
+    SEVERITY_COLOR = {
+        'Low': '#ffcc00',
+        'Medium': '#ff9900',
+        'High': '#ff3300',
+        'Critical': '#cc0000'
+    }
+    
     def __init__(self):
         self.database_url = os.getenv('DATABASE_URL')
         self.slack_token = os.getenv('SLACK_BOT_TOKEN')
         self.slack_channel = os.getenv('SLACK_CHANNEL', '#alerts')
         
+        # Alert writes and reads are short queries, so reuse connections instead of
+        # paying the connect/auth round trips on every call
+        self.pool = None
+        if self.database_url:
+            try:
+                self.pool = ThreadedConnectionPool(
+                    minconn=1,
+                    maxconn=int(os.getenv('ALERT_DB_POOL_SIZE', 10)),
+                    dsn=self.database_url
+                )
+            except Exception as e:
+                print(f"Failed to create alert database pool: {e}")
+        
+        # Alerts may be created from several threads; keep Slack under its rate limit
+        self.slack_rate_limiter = RateLimiter(float(os.getenv('SLACK_RATE_LIMIT_PER_SEC', 1)))
+        
+        # Cached results of get_active_alerts/get_alert_summary, cleared on every write
+        self._read_cache = TTLCache()
+        
         # Initialize Slack client if token is available
         self.slack_client = None
         if self.slack_token:
             try:
-                self.slack_client = WebClient(token=self.slack_token)
-                # Test connection
-                response = self.slack_client.auth_test()
-                print(f"Connected to Slack as: {response['user']}")
+                # slack_sdk pulls in a large HTTP/retry stack, so it is only imported when Slack is configured
+                from slack_sdk import WebClient
+                from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+                
+                # One SSL context for every request instead of reloading CA certificates per call
+                self.slack_client = WebClient(token=self.slack_token, ssl=ssl.create_default_context())
+                self.slack_client.retry_handlers.append(RateLimitErrorRetryHandler(max_retry_count=3))
             except Exception as e:
                 print(f"Failed to initialize Slack client: {e}")
                 self.slack_client = None
+        
+        # The token is checked with auth_test() on the first send rather than here,
+        # so constructing a manager costs no Slack round trip
+        self._slack_verified = None
+        
+        # Slack posts go through one background sender so create_alert returns after the INSERT;
+        # close() drains it, and the daemon flag keeps a forgotten close() from hanging exit
+        self._slack_queue = queue.Queue()
+        self._slack_thread = None
+        if self.slack_client:
+            self._slack_thread = threading.Thread(target=self._slack_worker, name='slack-notify', daemon=True)
+            self._slack_thread.start()
+    
+    @contextmanager
+    def _conn(self):
+        """Borrow a connection from the pool and return it when done"""
+        conn = self.pool.getconn()
+        try:
+            yield conn
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            # Broken connections are discarded so the pool opens a fresh one
+            self.pool.putconn(conn, close=bool(conn.closed))
     
     def create_alert(self, alert_data: Dict) -> bool:
         """Create a new alert in the database"""
-        if not self.database_url:
+        if not self.pool:
             print("DATABASE_URL not configured")
             return False
         
         try:
-            conn = psycopg2.connect(self.database_url)
-            cursor = conn.cursor()
-            
-            # Check if similar alert already exists and is active
-            cursor.execute("""
-                SELECT id FROM alerts 
-                WHERE shipment_id = %s 
-                AND alert_type = %s 
-                AND is_active = TRUE
-                AND triggered_at > NOW() - INTERVAL '1 hour'
-            """, (alert_data['shipment_id'], alert_data['alert_type']))
-            
-            if cursor.fetchone():
-                print(f"Similar alert already exists for {alert_data['shipment_id']}")
-                cursor.close()
-                conn.close()
-                return False
-            
-            # Insert new alert
-            cursor.execute("""
-                INSERT INTO alerts (
-                    shipment_id, alert_type, severity, title, message, metadata
-                ) VALUES (
-                    %(shipment_id)s, %(alert_type)s, %(severity)s, 
-                    %(title)s, %(message)s, %(metadata)s
-                )
-                RETURNING id
-            """, {
-                **alert_data,
-                'metadata': json.dumps(alert_data.get('metadata', {}))
-            })
+            with self._conn() as conn:
+                with conn.cursor() as cursor:
+                    # Dedup check and INSERT in one round trip. The transaction lock on the
+                    # key serializes concurrent creators, and the INSERT's snapshot is taken
+                    # after it, so the NOT EXISTS check sees any alert committed meanwhile
+                    cursor.execute("""
+                        SELECT pg_advisory_xact_lock(hashtextextended(%(shipment_id)s || ':' || %(alert_type)s, 0));
+                        
+                        WITH existing AS (
+                            SELECT id
+                            FROM alerts
+                            WHERE shipment_id = %(shipment_id)s
+                            AND alert_type = %(alert_type)s
+                            AND is_active = TRUE
+                            AND triggered_at > NOW() - make_interval(mins => %(dedup_minutes)s::int)
+                            ORDER BY triggered_at DESC
+                            LIMIT 1
+                        ), inserted AS (
+                            INSERT INTO alerts (
+                                shipment_id, alert_type, severity, title, message, metadata
+                            )
+                            SELECT
+                                %(shipment_id)s, %(alert_type)s, %(severity)s,
+                                %(title)s, %(message)s, %(metadata)s
+                            WHERE NOT EXISTS (SELECT 1 FROM existing)
+                            RETURNING id
+                        )
+                        SELECT id, TRUE FROM inserted
+                        UNION ALL
+                        SELECT id, FALSE FROM existing
+                    """, {
+                        **alert_data,
+                        'metadata': metadata_json(alert_data),
+                        'dedup_minutes': ALERT_DEDUP_MINUTES
+                    })
+                    
+                    alert_id, created = cursor.fetchone()
+                    if not created:
+                        print(f"Similar alert already exists for {alert_data['shipment_id']}")
+                        conn.rollback()
+                        return False
+                conn.commit()
             
-            alert_id = cursor.fetchone()[0]
-            conn.commit()
-            cursor.close()
-            conn.close()
+            self._read_cache.clear()
             
             print(f"Created alert {alert_id} for shipment {alert_data['shipment_id']}")
             
@@ -87,6 +228,86 @@ class AlertManager:
             print(f"Error creating alert: {e}")
             return False
     
+    def create_alerts_bulk(self, alerts: List[Dict]) -> int:
+        """Create many alerts with one dedup query and one multi-row INSERT"""
+        if not self.pool:
+            print("DATABASE_URL not configured")
+            return 0
+        
+        # Keep the first alert per key; the database check below drops already-active ones
+        pending = {}
+        for alert_data in alerts:
+            pending.setdefault((alert_data['shipment_id'], alert_data['alert_type']), alert_data)
+        
+        if not pending:
+            return 0
+        
+        try:
+            with self._conn() as conn:
+                with conn.cursor() as cursor:
+                    shipment_ids, alert_types = (list(column) for column in zip(*pending))
+                    # Take the same per-key locks as create_alert (in a fixed order, so
+                    # concurrent batches cannot deadlock) before checking for duplicates
+                    cursor.execute("""
+                        SELECT pg_advisory_xact_lock(hashtextextended(key, 0))
+                        FROM (
+                            SELECT shipment_id || ':' || alert_type AS key
+                            FROM unnest(%(shipment_ids)s::text[], %(alert_types)s::text[]) AS keys(shipment_id, alert_type)
+                        ) AS lock_keys
+                        ORDER BY key;
+                        
+                        SELECT DISTINCT ON (shipment_id, alert_type)
+                            shipment_id, alert_type
+                        FROM alerts
+                        WHERE (shipment_id, alert_type) IN (
+                            SELECT * FROM unnest(%(shipment_ids)s::text[], %(alert_types)s::text[])
+                        )
+                        AND is_active = TRUE
+                        AND triggered_at > NOW() - make_interval(mins => %(dedup_minutes)s::int)
+                        ORDER BY shipment_id, alert_type, triggered_at DESC
+                    """, {
+                        'shipment_ids': shipment_ids,
+                        'alert_types': alert_types,
+                        'dedup_minutes': ALERT_DEDUP_MINUTES
+                    })
+                    
+                    for shipment_id, alert_type in cursor.fetchall():
+                        print(f"Similar alert already exists for {shipment_id}")
+                        del pending[(shipment_id, alert_type)]
+                    
+                    if not pending:
+                        conn.rollback()
+                        return 0
+                    
+                    new_alerts = list(pending.values())
+                    execute_values(cursor, """
+                        INSERT INTO alerts (
+                            shipment_id, alert_type, severity, title, message, metadata
+                        ) VALUES %s
+                    """, [
+                        (
+                            alert_data['shipment_id'], alert_data['alert_type'], alert_data['severity'],
+                            alert_data['title'], alert_data['message'],
+                            metadata_json(alert_data)
+                        )
+                        for alert_data in new_alerts
+                    ], page_size=500)
+                conn.commit()
+            
+            self._read_cache.clear()
+            
+            print(f"Created {len(new_alerts)} alerts")
+            
+            # Notify only after the batch is committed
+            for alert_data in new_alerts:
+                self._send_notification(alert_data)
+            
+            return len(new_alerts)
+            
+        except Exception as e:
+            print(f"Error creating alerts: {e}")
+            return 0
+    
     def _send_notification(self, alert_data: Dict):
         """Send alert notification via configured channels"""
         # Console notification (always available)
@@ -94,7 +315,44 @@ class AlertManager:
         
         # Slack notification (if configured)
         if self.slack_client:
-            self._send_slack_notification(alert_data)
+            self._slack_queue.put(alert_data)
+    
+    def _slack_worker(self):
+        """Post queued notifications, merging alerts for the same shipment that piled up"""
+        while True:
+            batch = [self._slack_queue.get()]
+            while True:
+                try:
+                    batch.append(self._slack_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            groups: Dict[str, List[Dict]] = {}
+            for alert_data in batch:
+                if alert_data is not None:
+                    groups.setdefault(alert_data.get('shipment_id'), []).append(alert_data)
+            
+            for group in groups.values():
+                self._send_slack_notification(group[0] if len(group) == 1 else self._merge_alerts(group))
+            
+            # None is the shutdown signal from close()
+            if None in batch:
+                return
+    
+    def _merge_alerts(self, alerts: List[Dict]) -> Dict:
+        """Combine alerts for one shipment into a single message led by the most severe"""
+        merged = dict(max(alerts, key=lambda alert: SEVERITY_RANK.get(alert.get('severity'), 0)))
+        merged['message'] = "\n".join(alert.get('message', '') for alert in alerts)
+        return merged
+    
+    def close(self):
+        """Wait for queued notifications to be sent and release pooled connections"""
+        if self._slack_thread:
+            self._slack_queue.put(None)
+            self._slack_thread.join()
+            self._slack_thread = None
+        if self.pool:
+            self.pool.closeall()
     
     def _send_console_notification(self, alert_data: Dict):
         """Send alert to console/logs"""
@@ -103,16 +361,36 @@ class AlertManager:
         title = alert_data.get('title', 'Alert')
         message = alert_data.get('message', '')
         
-        print("\n" + "="*60)
-        print(f"🚨 ALERT - {severity.upper()} SEVERITY")
-        print(f"Shipment: {shipment_id}")
-        print(f"Title: {title}")
-        print(f"Message: {message}")
-        print(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print("="*60 + "\n")
+        # One write per alert instead of one per banner line
+        print(
+            f"\n{'=' * 60}\n"
+            f"🚨 ALERT - {severity.upper()} SEVERITY\n"
+            f"Shipment: {shipment_id}\n"
+            f"Title: {title}\n"
+            f"Message: {message}\n"
+            f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"{'=' * 60}\n"
+        )
+    
+    def _verify_slack(self) -> bool:
+        """Test the Slack connection once and remember the outcome"""
+        if self._slack_verified is None:
+            try:
+                response = self.slack_client.auth_test()
+                print(f"Connected to Slack as: {response['user']}")
+                self._slack_verified = True
+            except Exception as e:
+                print(f"Failed to connect to Slack, notifications disabled: {e}")
+                self._slack_verified = False
+        return self._slack_verified
     
     def _send_slack_notification(self, alert_data: Dict):
         """Send alert to Slack channel"""
+        from slack_sdk.errors import SlackApiError
+        
+        if not self._verify_slack():
+            return
+        
         try:
             severity = alert_data.get('severity', 'Medium')
             shipment_id = alert_data.get('shipment_id', 'Unknown')
@@ -120,22 +398,8 @@ class AlertManager:
             message = alert_data.get('message', '')
             
             # Choose emoji and color based on severity
-            emoji_map = {
-                'Low': '🟡',
-                'Medium': '🟠', 
-                'High': '🔴',
-                'Critical': '🚨'
-            }
-            
-            color_map = {
-                'Low': '#ffcc00',
-                'Medium': '#ff9900',
-                'High': '#ff3300',
-                'Critical': '#cc0000'
-            }
-            
-            emoji = emoji_map.get(severity, '⚠️')
-            color = color_map.get(severity, '#ff9900')
+            emoji = self.SEVERITY_EMOJI.get(severity, '⚠️')
+            color = self.SEVERITY_COLOR.get(severity, '#ff9900')
             
             # Create Slack message blocks
             blocks = [
@@ -186,6 +450,7 @@ class AlertManager:
                 })
             
             # Send message
+            self.slack_rate_limiter.acquire()
             response = self.slack_client.chat_postMessage(
                 channel=self.slack_channel,
                 text=f"{emoji} {title}",  # Fallback text
@@ -194,7 +459,7 @@ class AlertManager:
                     "color": color,
                     "fields": [{
                         "title": "Timestamp",
-                        "value": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        "value": time.strftime('%Y-%m-%d %H:%M:%S'),
                         "short": True
                     }]
                 }]
@@ -209,32 +474,38 @@ class AlertManager:
     
     def get_active_alerts(self, limit: int = 50) -> List[Dict]:
         """Get active alerts from database"""
-        if not self.database_url:
+        if not self.pool:
             return []
         
+        cache_key = ('active', limit)
+        cached = self._read_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        
         try:
-            conn = psycopg2.connect(self.database_url, cursor_factory=RealDictCursor)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT 
-                    a.*,
-                    s.origin,
-                    s.destination,
-                    s.current_location,
-                    s.status as shipment_status
-                FROM alerts a
-                JOIN shipments s ON a.shipment_id = s.shipment_id
-                WHERE a.is_active = TRUE
-                ORDER BY a.triggered_at DESC
-                LIMIT %s
-            """, (limit,))
-            
-            alerts = cursor.fetchall()
-            cursor.close()
-            conn.close()
-            
-            return [dict(alert) for alert in alerts]
+            with self._conn() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT 
+                            a.*,
+                            s.origin,
+                            s.destination,
+                            s.current_location,
+                            s.status as shipment_status
+                        FROM alerts a
+                        JOIN shipments s ON a.shipment_id = s.shipment_id
+                        WHERE a.is_active = TRUE
+                        ORDER BY a.triggered_at DESC
+                        LIMIT %s
+                    """, (limit,))
+                    
+                    # Plain tuples zipped with the column names once, instead of a dict-row per row plus a copy
+                    columns = [column.name for column in cursor.description]
+                    alerts = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                conn.rollback()
+            
+            self._read_cache.set(cache_key, alerts, ACTIVE_ALERTS_CACHE_TTL)
+            return copy.deepcopy(alerts)
             
         except Exception as e:
             print(f"Error fetching active alerts: {e}")
@@ -242,32 +513,30 @@ class AlertManager:
     
     def resolve_alert(self, alert_id: str, resolved_by: str = "system") -> bool:
         """Mark alert as resolved"""
-        if not self.database_url:
+        if not self.pool:
             return False
         
         try:
-            conn = psycopg2.connect(self.database_url)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE alerts 
-                SET is_active = FALSE, 
-                    resolved_at = NOW(),
-                    resolved_by = %s
-                WHERE id = %s
-                AND is_active = TRUE
-            """, (resolved_by, alert_id))
-            
-            if cursor.rowcount > 0:
-                conn.commit()
-                print(f"Resolved alert {alert_id}")
-                result = True
-            else:
-                print(f"Alert {alert_id} not found or already resolved")
-                result = False
-            
-            cursor.close()
-            conn.close()
+            with self._conn() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE alerts 
+                        SET is_active = FALSE, 
+                            resolved_at = NOW(),
+                            resolved_by = %s
+                        WHERE id = %s
+                        AND is_active = TRUE
+                    """, (resolved_by, alert_id))
+                    
+                    if cursor.rowcount > 0:
+                        conn.commit()
+                        self._read_cache.clear()
+                        print(f"Resolved alert {alert_id}")
+                        result = True
+                    else:
+                        conn.rollback()
+                        print(f"Alert {alert_id} not found or already resolved")
+                        result = False
             
             return result
             
@@ -277,51 +546,65 @@ class AlertManager:
     
     def get_alert_summary(self, hours: int = 24) -> Dict:
         """Get summary of alerts in the last N hours"""
-        if not self.database_url:
+        if not self.pool:
             return {}
         
+        cache_key = ('summary', hours)
+        cached = self._read_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        
         try:
-            conn = psycopg2.connect(self.database_url, cursor_factory=RealDictCursor)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT 
-                    severity,
-                    COUNT(*) as count,
-                    COUNT(CASE WHEN is_active THEN 1 END) as active_count
-                FROM alerts
-                WHERE triggered_at > NOW() - INTERVAL '%s hours'
-                GROUP BY severity
-                ORDER BY 
-                    CASE severity 
-                        WHEN 'Critical' THEN 4
-                        WHEN 'High' THEN 3
-                        WHEN 'Medium' THEN 2
-                        WHEN 'Low' THEN 1
-                        ELSE 0
-                    END DESC
-            """, (hours,))
-            
-            severity_summary = cursor.fetchall()
-            
-            cursor.execute("""
-                SELECT COUNT(*) as total_alerts,
-                       COUNT(CASE WHEN is_active THEN 1 END) as active_alerts,
-                       COUNT(CASE WHEN resolved_at IS NOT NULL THEN 1 END) as resolved_alerts
-                FROM alerts
-                WHERE triggered_at > NOW() - INTERVAL '%s hours'
-            """, (hours,))
-            
-            total_summary = cursor.fetchone()
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'summary': dict(total_summary),
-                'by_severity': [dict(row) for row in severity_summary],
+            with self._conn() as conn:
+                with conn.cursor() as cursor:
+                    # Per-severity rows plus the grand total (is_total) from one scan
+                    cursor.execute("""
+                        SELECT 
+                            severity,
+                            COUNT(*) as count,
+                            COUNT(CASE WHEN is_active THEN 1 END) as active_count,
+                            COUNT(resolved_at) as resolved_count,
+                            GROUPING(severity) = 1 as is_total
+                        FROM alerts
+                        WHERE triggered_at > NOW() - make_interval(hours => %s::int)
+                        GROUP BY GROUPING SETS ((severity), ())
+                        ORDER BY 
+                            GROUPING(severity),
+                            CASE severity 
+                                WHEN 'Critical' THEN 4
+                                WHEN 'High' THEN 3
+                                WHEN 'Medium' THEN 2
+                                WHEN 'Low' THEN 1
+                                ELSE 0
+                            END DESC
+                    """, (hours,))
+                    
+                    rows = cursor.fetchall()
+                conn.rollback()
+            
+            total_summary = {'total_alerts': 0, 'active_alerts': 0, 'resolved_alerts': 0}
+            severity_summary = []
+            for severity, count, active_count, resolved_count, is_total in rows:
+                if is_total:
+                    total_summary = {
+                        'total_alerts': count,
+                        'active_alerts': active_count,
+                        'resolved_alerts': resolved_count
+                    }
+                else:
+                    severity_summary.append({
+                        'severity': severity,
+                        'count': count,
+                        'active_count': active_count
+                    })
+            
+            summary = {
+                'summary': total_summary,
+                'by_severity': severity_summary,
                 'period_hours': hours
             }
+            self._read_cache.set(cache_key, summary, ALERT_SUMMARY_CACHE_TTL)
+            return copy.deepcopy(summary)
             
         except Exception as e:
             print(f"Error getting alert summary: {e}")
@@ -357,6 +640,8 @@ def test_alerting():
     # Get summary
     summary = alert_manager.get_alert_summary(24)
     print(f"Alert summary: {summary}")
+    
+    alert_manager.close()
 
 if __name__ == "__main__":
     test_alerting()
\ No newline at end of file
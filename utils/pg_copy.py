@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import io
+import struct
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Sequence
+
+import orjson
+
+# Binary COPY framing: signature, flags field, header extension length
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_TRAILER = struct.pack('!h', -1)
+
+POSTGRES_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+_NULL = struct.pack('!i', -1)
+_INT4 = struct.Struct('!i')
+_INT8 = struct.Struct('!q')
+_FLOAT8 = struct.Struct('!d')
+_NUMERIC_HEADER = struct.Struct('!hhHh')
+
+def _encode_text(value) -> bytes:
+    """Encode text, varchar and enum values (their binary form is the UTF-8 label)"""
+    return str(value).encode('utf-8')
+
+def _encode_int4(value) -> bytes:
+    return _INT4.pack(int(value))
+
+def _encode_float8(value) -> bytes:
+    return _FLOAT8.pack(float(value))
+
+def _encode_bool(value) -> bytes:
+    return b'\x01' if value else b'\x00'
+
+def _encode_timestamptz(value) -> bytes:
+    """Encode a datetime as microseconds since 2000-01-01 UTC (naive values are taken as UTC)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - POSTGRES_EPOCH
+    return _INT8.pack((delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+def _encode_timestamp(value) -> bytes:
+    """Encode a timestamp without time zone as wall-clock microseconds since 2000-01-01"""
+    return _encode_timestamptz(value.replace(tzinfo=None))
+
+def _encode_jsonb(value) -> bytes:
+    """Encode a JSONB value: format version 1 followed by the JSON text"""
+    if not isinstance(value, (bytes, str)):
+        value = orjson.dumps(value)
+    elif isinstance(value, str):
+        value = value.encode('utf-8')
+    return b'\x01' + value
+
+def _encode_numeric(value) -> bytes:
+    """Encode a numeric as base-10000 digit groups with weight, sign and display scale"""
+    value = Decimal(str(value))
+    if value.is_nan():
+        return _NUMERIC_HEADER.pack(0, 0, 0xC000, 0)
+
+    sign, digits, exponent = value.as_tuple()
+    digits = ''.join(map(str, digits))
+    if exponent > 0:
+        digits += '0' * exponent
+        exponent = 0
+
+    scale = -exponent
+    digits = digits.zfill(scale + 1)
+    integer_part = digits[:len(digits) - scale]
+    fraction_part = digits[len(digits) - scale:]
+
+    # Align both parts to groups of four decimal digits around the decimal point
+    integer_part = integer_part.zfill(-(-len(integer_part) // 4) * 4)
+    fraction_part = fraction_part.ljust(-(-len(fraction_part) // 4) * 4, '0')
+
+    groups = [int(integer_part[i:i + 4]) for i in range(0, len(integer_part), 4)]
+    weight = len(groups) - 1
+    groups += [int(fraction_part[i:i + 4]) for i in range(0, len(fraction_part), 4)]
+
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+
+    return (
+        _NUMERIC_HEADER.pack(len(groups), weight, 0x4000 if sign else 0, scale)
+        + struct.pack(f'!{len(groups)}h', *groups)
+    )
+
+ENCODERS: Dict[str, Callable] = {
+    'text': _encode_text,
+    'int4': _encode_int4,
+    'float8': _encode_float8,
+    'bool': _encode_bool,
+    'numeric': _encode_numeric,
+    'timestamp': _encode_timestamp,
+    'timestamptz': _encode_timestamptz,
+    'jsonb': _encode_jsonb,
+}
+
+def encode_binary_copy(rows: Iterable[Sequence], column_types: Sequence[str]) -> io.BytesIO:
+    """Encode rows into a buffer in PostgreSQL's binary COPY format"""
+    encoders: List[Callable] = [ENCODERS[column_type] for column_type in column_types]
+    field_count = struct.pack('!h', len(encoders))
+
+    buffer = io.BytesIO()
+    buffer.write(COPY_HEADER)
+
+    for row in rows:
+        buffer.write(field_count)
+        for encode, value in zip(encoders, row):
+            if value is None:
+                buffer.write(_NULL)
+                continue
+            data = encode(value)
+            buffer.write(_INT4.pack(len(data)))
+            buffer.write(data)
+
+    buffer.write(COPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+def copy_binary(cursor, table: str, columns: Sequence[str], column_types: Sequence[str], rows: Iterable[Sequence]):
+    """Load rows into a table with COPY ... FROM STDIN (FORMAT binary)"""
+    buffer = encode_binary_copy(rows, column_types)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)",
+        buffer
+    )